@@ -3,7 +3,7 @@ import uuid
 from datetime import datetime
 import pytz
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.dialects.postgresql import UUID, ARRAY
+from sqlalchemy.dialects.postgresql import UUID, ARRAY, JSONB
 from sqlalchemy import Sequence, event
 import uuid
 from sqlalchemy.dialects.postgresql import UUID
@@ -29,6 +29,8 @@ class Camera(db.Model):
     camera_name  = db.Column(db.String(50), nullable=False, unique=True, index=True)
     camera_url   = db.Column(db.Text, nullable=False, unique=True)
     tag          = db.Column(db.String(50), nullable=False)
+    # detection region: [x1, y1, x2, y2] or [[x, y], ...] in 0..1 frame coords, NULL = whole frame
+    roi          = db.Column(JSONB, nullable=True)
 
     detections   = db.relationship(
         'Detection', back_populates='camera', lazy='dynamic', passive_deletes=True
@@ -98,7 +100,8 @@ class Img(db.Model):
 class Embedding(db.Model):
     __tablename__ = 'embedding'
     id         = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    embedding  = db.Column(ARRAY(db.Float), nullable=False)
+    # big-endian float32/float16 blob, see app/utils/embedding_codec.py
+    embedding  = db.Column(db.LargeBinary, nullable=False)
     calculator = db.Column(db.String(255), nullable=False)
     subject_id = db.Column(UUID(as_uuid=True), db.ForeignKey('subject.id'), nullable=False)
     img_id     = db.Column(UUID(as_uuid=True), db.ForeignKey('img.id'), nullable=False)
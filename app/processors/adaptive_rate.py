@@ -0,0 +1,81 @@
+# app/processors/adaptive_rate.py
+import threading
+import time
+
+class AdaptiveSampler:
+    """
+    Per-camera AI sampling rate driven by scene activity.
+
+    A camera that recently had faces (or motion) runs at `max_rate`; once it
+    goes quiet the rate is held for `hold_s` seconds and then halves every
+    `half_life_s` seconds down to `min_rate`. The rates of all cameras are
+    scaled down together whenever their sum exceeds `budget` (AI frames per
+    second for the whole process), busy cameras keeping the larger share.
+    """
+    def __init__(self, min_rate=1.0, max_rate=8.0, hold_s=5.0, half_life_s=5.0,
+                 budget=30.0, idle_camera_s=10.0):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.hold_s = hold_s
+        self.half_life_s = half_life_s
+        self.budget = budget
+        self.idle_camera_s = idle_camera_s   # cameras not polled this long leave the budget
+        self._lock = threading.Lock()
+        self._cams = {}   # cam_name → {'last_activity', 'last_ai', 'last_seen', 'rate'}
+
+    def _state(self, cam_name, now):
+        st = self._cams.get(cam_name)
+        if st is None:
+            # new cameras start active so the first faces aren't missed
+            st = self._cams[cam_name] = {
+                'last_activity': now, 'last_ai': 0.0, 'last_seen': now, 'rate': self.max_rate
+            }
+        return st
+
+    def _desired(self, st, now):
+        idle = now - st['last_activity'] - self.hold_s
+        if idle <= 0:
+            return self.max_rate
+        return max(self.min_rate, self.max_rate * 0.5 ** (idle / self.half_life_s))
+
+    def _rebalance(self, now):
+        """Recompute every live camera's rate under the global budget (call under lock)."""
+        live = {
+            cam: st for cam, st in self._cams.items()
+            if now - st['last_seen'] <= self.idle_camera_s
+        }
+        desired = {cam: self._desired(st, now) for cam, st in live.items()}
+        total = sum(desired.values())
+        scale = min(1.0, self.budget / total) if self.budget > 0 and total > 0 else 1.0
+        for cam, rate in desired.items():
+            live[cam]['rate'] = rate * scale
+
+    def should_process(self, cam_name, now=None):
+        """True if this camera's next frame should go through AI."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            st = self._state(cam_name, now)
+            st['last_seen'] = now
+            self._rebalance(now)
+            if st['rate'] <= 0 or now - st['last_ai'] < 1.0 / st['rate']:
+                return False
+            st['last_ai'] = now
+            return True
+
+    def report(self, cam_name, faces=0, motion=False, now=None):
+        """Feed back what the last AI pass (or motion check) saw."""
+        if not faces and not motion:
+            return
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._state(cam_name, now)['last_activity'] = now
+
+    def rate(self, cam_name):
+        """Current sampling rate (AI frames per second) of a camera."""
+        with self._lock:
+            st = self._cams.get(cam_name)
+            return st['rate'] if st else 0.0
+
+    def forget(self, cam_name):
+        with self._lock:
+            self._cams.pop(cam_name, None)
@@ -0,0 +1,83 @@
+# app/processors/detection_events.py
+import threading
+import time
+
+class DetectionCoalescer:
+    """
+    Turns a per-frame stream of recognitions into presence events.
+
+    Sightings are keyed by (camera, subject) — or (camera, track) for unknown
+    faces — and only these produce a Detection row + saved crop:
+      * entry: first sighting, or first after `cooldown` seconds unseen
+      * periodic: every `periodic_interval` seconds while present (0 = off)
+      * best quality: when a sighting clearly beats the best one already
+        stored for the current visit (optional)
+    """
+    def __init__(self, cooldown=30.0, periodic_interval=0.0, best_quality=False,
+                 quality_margin=0.05, min_update_interval=2.0):
+        self.cooldown = cooldown
+        self.periodic_interval = periodic_interval
+        self.best_quality = best_quality
+        self.quality_margin = quality_margin
+        self.min_update_interval = min_update_interval
+        self._lock = threading.Lock()
+        self._events = {}     # key → {'first_seen', 'last_seen', 'last_emit', 'best_quality'}
+        self._last_prune = time.monotonic()
+        self.stats = {'seen': 0, 'emitted': 0, 'suppressed': 0}
+
+    @staticmethod
+    def _key(cam_name, subject, is_unknown, track_id):
+        if is_unknown:
+            return (cam_name, 'track', track_id if track_id is not None else subject)
+        return (cam_name, 'subject', subject)
+
+    @staticmethod
+    def _quality(probability, distance, is_unknown):
+        # detector confidence, plus recognition confidence for known faces
+        return probability if is_unknown else probability - distance
+
+    def should_emit(self, cam_name, subject, is_unknown, track_id, probability, distance, now=None):
+        """Record one sighting; True if it should be written out as a Detection."""
+        now = time.monotonic() if now is None else now
+        key = self._key(cam_name, subject, is_unknown, track_id)
+        quality = self._quality(probability, distance, is_unknown)
+
+        with self._lock:
+            self.stats['seen'] += 1
+            self._prune(now)
+            evt = self._events.get(key)
+
+            if evt is None or now - evt['last_seen'] > self.cooldown:
+                # entry
+                self._events[key] = {
+                    'first_seen': now, 'last_seen': now,
+                    'last_emit': now, 'best_quality': quality
+                }
+                self.stats['emitted'] += 1
+                return True
+
+            evt['last_seen'] = now
+            since_emit = now - evt['last_emit']
+            emit = False
+            if self.periodic_interval > 0 and since_emit >= self.periodic_interval:
+                emit = True
+            elif (self.best_quality and since_emit >= self.min_update_interval
+                  and quality > evt['best_quality'] + self.quality_margin):
+                emit = True
+
+            if emit:
+                evt['last_emit'] = now
+                evt['best_quality'] = max(evt['best_quality'], quality)
+                self.stats['emitted'] += 1
+            else:
+                self.stats['suppressed'] += 1
+            return emit
+
+    def _prune(self, now):
+        """Forget visits that ended more than one cooldown ago (called under lock)."""
+        if now - self._last_prune < self.cooldown:
+            return
+        self._last_prune = now
+        stale = [k for k, evt in self._events.items() if now - evt['last_seen'] > self.cooldown]
+        for k in stale:
+            del self._events[k]
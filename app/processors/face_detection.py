@@ -6,8 +6,14 @@ from collections import defaultdict
 from flask import current_app
 from integrations.custom_service import cutm_integ
 from app.processors.frame_draw import drawing_on_frame
-from app.processors.save_face import save_image
+from app.processors.save_face import save_image, scale_box
+from app.processors.face_tracker import FaceTracker
+from app.processors.detection_events import DetectionCoalescer
+from app.processors.adaptive_rate import AdaptiveSampler
+from app.processors.motion_gate import MotionGate
 from app.models.model import db, Detection, Subject, Camera, Detection
+from app.services.detection_writer import detection_writer
+from app.services.camera_manager import camera_service
 from config.paths import FACE_REC_TH, FACE_DET_TH
 from config.logger_config import cam_stat_logger, console_logger, exec_time_logger, det_logger
 from datetime import datetime
@@ -15,6 +21,12 @@ import timeit
 import psutil
 import ctypes
 from config.paths import IS_GEN_REPORT, SKIP_FRAME_CYCLE, AI_PROCESS_FRAMES, DETECTION_OVERLAY_OPTION
+from config.paths import FACE_TRACKING, TRACK_IOU_TH, TRACK_MAX_MISSED, TRACK_RECHECK_S, TRACK_UNSURE_RECHECK_S
+from config.paths import ANTI_SPOOF_RECHECK_S
+from config.paths import DET_COALESCE, DET_COOLDOWN_S, DET_PERIODIC_S, DET_BEST_QUALITY
+from config.paths import DECODE_MODE, DECODE_FPS, DECODE_PREVIEW_FPS
+from config.paths import ADAPTIVE_RATE, AI_RATE_MIN, AI_RATE_MAX, AI_RATE_HOLD_S, AI_RATE_HALF_LIFE_S, AI_RATE_BUDGET
+from config.paths import MOTION_GATE, MOTION_WIDTH, MOTION_PIXEL_TH, MOTION_SENSITIVITY, MOTION_MAX_IDLE_S, MOTION_CAMERAS
 
 class FaceDetectionProcessor:
     def __init__(self, db_session, app):
@@ -30,51 +42,95 @@ class FaceDetectionProcessor:
         self.frame_cycle = SKIP_FRAME_CYCLE            # Total frames in cycle 10
         self.process_frames = AI_PROCESS_FRAMES        # Process AI on first N frames of each cycle 2
         self.overlay_option = DETECTION_OVERLAY_OPTION # 1 = show last drawings, 2 = clean frames
+        if DECODE_MODE != "full":
+            # ffmpeg already dropped the frames we would skip here
+            self.frame_cycle, self.process_frames = self._reduced_decode_cycle()
         
         # Per-camera frame counting and caching
         self.frame_counts = defaultdict(int)
         self.last_ai_results = defaultdict(lambda: None)
         self.last_ai_timestamp = defaultdict(float)
+
+        # Per-camera face trackers: recognition only re-runs for new/unsure tracks
+        self.trackers = defaultdict(self._new_tracker)
+
+        # Report rows are written per visit, not per frame
+        self.coalescer = DetectionCoalescer(
+            cooldown=DET_COOLDOWN_S,
+            periodic_interval=DET_PERIODIC_S,
+            best_quality=DET_BEST_QUALITY
+        ) if DET_COALESCE else None
+
+        # Activity-driven AI rate per camera, under one global budget
+        self.sampler = AdaptiveSampler(
+            min_rate=AI_RATE_MIN,
+            max_rate=AI_RATE_MAX,
+            hold_s=AI_RATE_HOLD_S,
+            half_life_s=AI_RATE_HALF_LIFE_S,
+            budget=AI_RATE_BUDGET
+        ) if ADAPTIVE_RATE else None
+
+        # Skip detection on frames where nothing moved
+        self.motion_gate = MotionGate(
+            width=MOTION_WIDTH,
+            pixel_threshold=MOTION_PIXEL_TH,
+            sensitivity=MOTION_SENSITIVITY,
+            max_idle_s=MOTION_MAX_IDLE_S,
+            cameras=MOTION_CAMERAS
+        ) if MOTION_GATE else None
         
         # FPS calculation (for AI processing only)
         self.fps_data = defaultdict(lambda: {
             'ai_processed_count': 0,
             'ai_start_time': time.time(),
             'last_fps_calc': time.time(),
-            'current_fps': 0.0
+            'current_fps': 0.0,
+            'capture_latency': 0.0,  # smoothed seconds from decode to AI result
+            'target_rate': 0.0,      # adaptive AI rate the sampler allows right now
+            'motion_skipped': 0      # AI frames skipped by the motion gate
         })
         
         exec_time_logger.info(
             f"FaceDetectionProcessor initialized with frame skipping: "
-            f"{self.process_frames}/{self.frame_cycle} frames"
+            f"{self.process_frames}/{self.frame_cycle} frames ({DECODE_MODE} decode)"
         )
 
-    def process_frame(self, frame, cam_name):
+    def process_frame(self, frame, cam_name, captured_at=None, hires=None):
         """Main processing method with built-in frame skipping"""
         
         # Increment frame counter
         self.frame_counts[cam_name] += 1
         
-        # Decide if we should do AI processing (your original style)
-        should_process_ai = self.frame_counts[cam_name] % self.frame_cycle < self.process_frames
+        if self.sampler is not None:
+            # rate follows scene activity instead of a fixed cycle
+            should_process_ai = self.sampler.should_process(cam_name)
+            self.fps_data[cam_name]['target_rate'] = self.sampler.rate(cam_name)
+        else:
+            # Decide if we should do AI processing (your original style)
+            should_process_ai = self.frame_counts[cam_name] % self.frame_cycle < self.process_frames
+
+        if should_process_ai and not self._passes_motion_gate(frame, cam_name):
+            should_process_ai = False
         
         if should_process_ai:
             # Do AI processing
-            return self._process_with_ai(frame, cam_name)
+            return self._process_with_ai(frame, cam_name, captured_at, hires)
         else:
             # Skip AI, handle according to overlay option
             return self._process_without_ai(frame, cam_name)
     
-    def _process_with_ai(self, frame, cam_name):
+    def _process_with_ai(self, frame, cam_name, captured_at=None, hires=None):
         """Process frame with AI detection (expensive)"""
         
         # AI processing with timing
         ai_start = time.time()
-        results = cutm_integ(frame)
+        tracker = self.trackers[cam_name] if FACE_TRACKING else None
+        roi = camera_service.get_roi(cam_name)
+        results = cutm_integ(frame, cam_name, tracker=tracker, hires=hires, roi=roi)
         ai_time = time.time() - ai_start
         
         # Update FPS calculation
-        self._update_fps_stats(cam_name, ai_time)
+        self._update_fps_stats(cam_name, ai_time, captured_at)
         
         # Memory cleanup (your existing logic) not doing it right now
         # self.call_counter += 1
@@ -87,13 +143,16 @@ class FaceDetectionProcessor:
         #     print(f"Memory cleanup done. Freed: {freed_memory / (1024 * 1024):.2f} MB")
         #     self.call_counter = 0
         
+        if self.sampler is not None:
+            self.sampler.report(cam_name, faces=len(results or []))
+
         # Cache AI results for non-processed frames
         if results:
             self.last_ai_results[cam_name] = results
             self.last_ai_timestamp[cam_name] = time.time()
         
         # Process and draw results
-        processed_frame = self._apply_results_to_frame(frame, results, cam_name)
+        processed_frame = self._apply_results_to_frame(frame, results, cam_name, hires=hires)
         
         # Periodic logging with FPS info
         if self.frame_counts[cam_name] % 50 == 0:
@@ -101,11 +160,45 @@ class FaceDetectionProcessor:
             exec_time_logger.info(
                 f"[{cam_name}] Frame {self.frame_counts[cam_name]} | "
                 f"AI FPS: {fps_info['current_fps']:.1f} | "
-                f"AI Time: {ai_time:.3f}s"
+                f"AI Time: {ai_time:.3f}s | "
+                f"Capture→result: {fps_info['capture_latency']:.3f}s"
             )
         
         return processed_frame
     
+    def _passes_motion_gate(self, frame, cam_name):
+        """Pre-stage: False when the frame shows no change worth running the detector on"""
+        if self.motion_gate is None:
+            return True
+        # faces on screen right now: keep detecting even if they stand still
+        if self.last_ai_results[cam_name] and time.time() - self.last_ai_timestamp[cam_name] < 2.0:
+            return True
+        if not self.motion_gate.changed(cam_name, frame, roi=camera_service.get_roi(cam_name)):
+            self.fps_data[cam_name]['motion_skipped'] += 1
+            return False
+        if self.sampler is not None:
+            self.sampler.report(cam_name, motion=True)
+        return True
+
+    @staticmethod
+    def _reduced_decode_cycle():
+        """(frame_cycle, process_frames) when the decoder already outputs a reduced rate."""
+        if DECODE_MODE == "decimate" and DECODE_PREVIEW_FPS > DECODE_FPS:
+            # preview frames arrive at DECODE_PREVIEW_FPS, AI runs on DECODE_FPS of them
+            return max(1, round(DECODE_PREVIEW_FPS)), max(1, round(DECODE_FPS))
+        # every decoded frame (decimated or keyframe) goes through AI
+        return 1, 1
+
+    def _new_tracker(self):
+        return FaceTracker(
+            iou_threshold=TRACK_IOU_TH,
+            max_missed=TRACK_MAX_MISSED,
+            recheck_interval=TRACK_RECHECK_S,
+            unsure_recheck_interval=TRACK_UNSURE_RECHECK_S,
+            confident_distance=float(FACE_REC_TH),
+            spoof_recheck_interval=ANTI_SPOOF_RECHECK_S
+        )
+
     def _process_without_ai(self, frame, cam_name):
         """Process frame without AI (use cached results or clean frame)"""
         
@@ -124,7 +217,7 @@ class FaceDetectionProcessor:
             # No recent AI results, return clean frame
             return frame
     
-    def _apply_results_to_frame(self, frame, results, cam_name, is_cached=False):
+    def _apply_results_to_frame(self, frame, results, cam_name, is_cached=False, hires=None):
         """Apply AI results to frame using existing drawing logic"""
         
         if not results:
@@ -160,37 +253,44 @@ class FaceDetectionProcessor:
             )
             
             # Save image and database operations (only for fresh AI results, not cached)
-            if IS_GEN_REPORT and not is_cached:
-                face_path = save_image(processed_frame, cam_name, box, subject, distance, is_unknown)
+            if IS_GEN_REPORT and not is_cached and self._should_report(
+                cam_name, subject, is_unknown, result.get('track_id'), probability, distance
+            ):
+                if hires is not None:
+                    # report crop from the high-res frame of the same instant
+                    face_path = save_image(hires, cam_name, scale_box(box, frame, hires), subject, distance, is_unknown)
+                else:
+                    face_path = save_image(processed_frame, cam_name, box, subject, distance, is_unknown)
                 face_url = f"/faces/{face_path}"  # Just the relative path!
                 
-                with self.app.app_context():
-                    if not is_unknown:
-                        subj = Subject.query.filter_by(subject_name=subject).first()
-                    else:
-                        subj = None  # This will store NULL in the subject foreign key column in Postgres
-                    cam = Camera.query.filter_by(camera_name=cam_name).first()
-                    det = Detection(
-                        subject=subj,
-                        camera=cam,
-                        det_score=probability * 100,
-                        distance=distance,
-                        det_face=face_url
-                    )
-                    self.db_session.add(det)
-                    self.db_session.commit()
-                           
-                    # # Commit every 10 detections
-                    # if len(self.db_session.new) % 10 == 0:
-                    #     self.db_session.commit()
+                # queued for the background writer; never blocks on Postgres
+                detection_writer.enqueue(
+                    cam_name, subject,
+                    det_score=probability * 100,
+                    distance=distance,
+                    det_face=face_url,
+                    is_unknown=is_unknown
+                )
         return processed_frame
     
-    def _update_fps_stats(self, cam_name, processing_time):
+    def _should_report(self, cam_name, subject, is_unknown, track_id, probability, distance):
+        """Coalesce repeated sightings of the same person into one Detection per visit"""
+        if self.coalescer is None:
+            return True
+        return self.coalescer.should_emit(cam_name, subject, is_unknown, track_id, probability, distance)
+
+    def _update_fps_stats(self, cam_name, processing_time, captured_at=None):
         """Update FPS calculation for AI processing"""
         fps_info = self.fps_data[cam_name]
         fps_info['ai_processed_count'] += 1
         
         current_time = time.time()
+
+        # capture → result latency (queueing + inference), exponentially smoothed
+        if captured_at is not None:
+            latency = current_time - captured_at
+            prev = fps_info['capture_latency']
+            fps_info['capture_latency'] = latency if prev == 0.0 else 0.9 * prev + 0.1 * latency
         
         # Calculate FPS every 5 seconds
         if current_time - fps_info['last_fps_calc'] >= 5.0:
@@ -211,7 +311,11 @@ class FaceDetectionProcessor:
                 'ai_processed_frames': ai_processed,
                 'ai_fps': fps_info['current_fps'],
                 'processing_ratio': f"{ai_processed}/{total_frames} ({(ai_processed/total_frames*100):.1f}%)" if total_frames > 0 else "0%",
-                'skip_config': f"{self.process_frames}/{self.frame_cycle}"
+                'skip_config': "adaptive" if self.sampler is not None else f"{self.process_frames}/{self.frame_cycle}",
+                'effective_rate': round(fps_info['target_rate'], 2) if self.sampler is not None else None,
+                'motion_skipped': fps_info['motion_skipped'],
+                'capture_latency_ms': round(fps_info['capture_latency'] * 1000, 1),
+                'tracker': dict(self.trackers[cam_name].stats) if cam_name in self.trackers else None
             }
         
         return stats
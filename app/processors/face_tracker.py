@@ -0,0 +1,155 @@
+# app/processors/face_tracker.py
+import itertools
+import time
+import numpy as np
+
+_track_ids = itertools.count(1)
+
+def iou(box_a, box_b):
+    """Intersection-over-union of two [x1, y1, x2, y2] boxes."""
+    x1 = max(box_a[0], box_b[0])
+    y1 = max(box_a[1], box_b[1])
+    x2 = min(box_a[2], box_b[2])
+    y2 = min(box_a[3], box_b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    if inter <= 0:
+        return 0.0
+    area_a = (box_a[2] - box_a[0]) * (box_a[3] - box_a[1])
+    area_b = (box_b[2] - box_b[0]) * (box_b[3] - box_b[1])
+    return inter / float(area_a + area_b - inter)
+
+class Track:
+    """One face followed across AI frames of a single camera."""
+    def __init__(self, bbox, now):
+        self.id = next(_track_ids)
+        self.bbox = np.asarray(bbox[:4], dtype=np.float32)
+        self.velocity = np.zeros(4, dtype=np.float32)  # per-frame box delta
+        self.hits = 1
+        self.missed = 0
+        self.created = now
+
+        # identity confirmed by the recognizer
+        self.subject_name = None
+        self.subject_id = None
+        self.distance = None
+        self.embedding = None
+        self.last_recognized = None
+
+        # liveness verdict (is_spoof, score, duration) of the last anti-spoof run
+        self.spoof_res = None
+        self.spoof_checked = None
+
+    def predict(self):
+        """Constant-velocity guess of where the box is this frame."""
+        return self.bbox + self.velocity
+
+    def update(self, bbox, smoothing=0.5):
+        bbox = np.asarray(bbox[:4], dtype=np.float32)
+        self.velocity = smoothing * (bbox - self.bbox) + (1 - smoothing) * self.velocity
+        self.bbox = bbox
+        self.hits += 1
+        self.missed = 0
+
+    @property
+    def has_identity(self):
+        return self.subject_name is not None
+
+class FaceTracker:
+    """
+    Per-camera SORT-style tracker: boxes are predicted with a constant-velocity
+    model and greedily associated to new detections by IoU. Each track keeps
+    the identity and embedding from its last recognition so the recognizer
+    only has to run for new tracks, periodically, or while the match is weak.
+    """
+    def __init__(self, iou_threshold=0.3, max_missed=5, recheck_interval=3.0,
+                 unsure_recheck_interval=0.5, confident_distance=0.8,
+                 spoof_recheck_interval=2.0):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.recheck_interval = recheck_interval
+        self.unsure_recheck_interval = unsure_recheck_interval
+        self.confident_distance = confident_distance
+        self.spoof_recheck_interval = spoof_recheck_interval
+        self.tracks = []
+        self.stats = {'recognized': 0, 'reused': 0, 'spoof_checked': 0, 'spoof_reused': 0}
+
+    def update(self, boxes, now=None):
+        """
+        Associate this frame's detections with existing tracks.
+        Returns one Track per box, in the same order as boxes.
+        """
+        now = time.monotonic() if now is None else now
+        predicted = [t.predict() for t in self.tracks]
+
+        # greedy association, best IoU first
+        pairs = []
+        for d, box in enumerate(boxes):
+            for t, pred in enumerate(predicted):
+                score = iou(box, pred)
+                if score >= self.iou_threshold:
+                    pairs.append((score, d, t))
+        pairs.sort(reverse=True)
+
+        assigned = [None] * len(boxes)
+        used_tracks = set()
+        for _, d, t in pairs:
+            if assigned[d] is not None or t in used_tracks:
+                continue
+            self.tracks[t].update(boxes[d])
+            assigned[d] = self.tracks[t]
+            used_tracks.add(t)
+
+        # age the tracks nobody matched, drop the stale ones
+        survivors = []
+        for t, track in enumerate(self.tracks):
+            if t not in used_tracks:
+                track.missed += 1
+                track.bbox = predicted[t]
+            if track.missed <= self.max_missed:
+                survivors.append(track)
+
+        # unmatched detections start new tracks
+        for d, box in enumerate(boxes):
+            if assigned[d] is None:
+                assigned[d] = Track(box, now)
+                survivors.append(assigned[d])
+
+        self.tracks = survivors
+        return assigned
+
+    def needs_recognition(self, track, now=None):
+        """New track, periodic re-check, or weak/unknown match → run the recognizer."""
+        now = time.monotonic() if now is None else now
+        if not track.has_identity or track.last_recognized is None:
+            return True
+        interval = self.recheck_interval
+        if track.distance is None or track.distance > self.confident_distance:
+            interval = self.unsure_recheck_interval
+        if now - track.last_recognized >= interval:
+            return True
+        self.stats['reused'] += 1
+        return False
+
+    def record_identity(self, track, subject_name, distance, embedding, subject_id=None, now=None):
+        track.subject_name = subject_name
+        track.subject_id = subject_id
+        track.distance = distance
+        track.embedding = embedding
+        track.last_recognized = time.monotonic() if now is None else now
+        self.stats['recognized'] += 1
+
+    def needs_spoof_check(self, track, now=None):
+        """New track or stale liveness verdict → run the anti-spoof ensemble."""
+        now = time.monotonic() if now is None else now
+        if track.spoof_res is None or now - track.spoof_checked >= self.spoof_recheck_interval:
+            return True
+        self.stats['spoof_reused'] += 1
+        return False
+
+    def record_spoof(self, track, spoof_res, now=None):
+        track.spoof_res = spoof_res
+        track.spoof_checked = time.monotonic() if now is None else now
+        self.stats['spoof_checked'] += 1
+
+    def reset(self):
+        self.tracks = []
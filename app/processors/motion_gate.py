@@ -0,0 +1,103 @@
+# app/processors/motion_gate.py
+import threading
+import time
+import cv2
+import numpy as np
+from app.utils.roi import roi_polygon
+
+class MotionGate:
+    """
+    Cheap per-camera change detector run before face detection.
+
+    Each candidate frame is shrunk to a `width`-pixel grayscale thumbnail and
+    compared with a running-average background; if less than `sensitivity`
+    (fraction of the ROI) changed by more than `pixel_threshold` levels, the
+    detector is skipped. The ROI is the camera's detection ROI unless
+    set_camera() gives the gate its own. A frame is still let through every `max_idle_s`
+    seconds so slow or static scenes get re-checked.
+    """
+    def __init__(self, width=160, pixel_threshold=25, sensitivity=0.002,
+                 learning_rate=0.05, max_idle_s=5.0, cameras=None):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.sensitivity = sensitivity
+        self.learning_rate = learning_rate
+        self.max_idle_s = max_idle_s
+        self._lock = threading.Lock()
+        self._config = {}   # cam_name → {'sensitivity', 'roi'}
+        self._state = {}    # cam_name → {'background', 'mask', 'roi', 'last_pass'}
+        self.stats = {'checked': 0, 'passed': 0, 'skipped': 0}
+        for cam_name, cfg in (cameras or {}).items():
+            self.set_camera(cam_name, **cfg)
+
+    def set_camera(self, cam_name, sensitivity=None, roi=None):
+        """Per-camera sensitivity and ROI (rect or polygon, normalised coords; overrides the detection ROI)."""
+        with self._lock:
+            self._config[cam_name] = {'sensitivity': sensitivity, 'roi': roi_polygon(roi)}
+            # rebuild background and mask on the next frame
+            self._state.pop(cam_name, None)
+
+    def forget(self, cam_name):
+        with self._lock:
+            self._state.pop(cam_name, None)
+
+    def _thumbnail(self, frame):
+        h, w = frame.shape[:2]
+        size = (self.width, max(1, round(h * self.width / w)))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    @staticmethod
+    def _mask(shape, polygon):
+        if polygon is None:
+            return None
+        h, w = shape
+        pts = np.array([[x * (w - 1), y * (h - 1)] for x, y in polygon], dtype=np.int32)
+        mask = np.zeros(shape, dtype=np.uint8)
+        cv2.fillPoly(mask, [pts], 255)
+        return mask
+
+    def changed(self, cam_name, frame, now=None, roi=None):
+        """
+        True if the frame differs enough from the background to be worth
+        detecting on. `roi` is the camera's detection ROI (None = whole frame).
+        """
+        now = time.monotonic() if now is None else now
+        gray = self._thumbnail(frame)
+        with self._lock:
+            cfg = self._config.get(cam_name, {})
+            polygon = cfg['roi'] if cfg.get('roi') is not None else roi_polygon(roi)
+            st = self._state.get(cam_name)
+            if st is None or st['background'].shape != gray.shape:
+                st = self._state[cam_name] = {
+                    'background': gray.astype(np.float32),
+                    'mask': self._mask(gray.shape, polygon),
+                    'roi': polygon,
+                    'last_pass': now,
+                }
+                self.stats['passed'] += 1
+                return True
+            if st['roi'] != polygon:
+                # detection ROI edited while running: the background stays valid
+                st['mask'], st['roi'] = self._mask(gray.shape, polygon), polygon
+            background, mask = st['background'], st['mask']
+            sensitivity = cfg['sensitivity'] if cfg.get('sensitivity') is not None else self.sensitivity
+
+            diff = cv2.absdiff(gray, cv2.convertScaleAbs(background))
+            moving = diff > self.pixel_threshold
+            if mask is not None:
+                moving &= mask.astype(bool)
+                area = max(1, cv2.countNonZero(mask))
+            else:
+                area = moving.size
+            ratio = np.count_nonzero(moving) / area
+            cv2.accumulateWeighted(gray, background, self.learning_rate)
+
+            self.stats['checked'] += 1
+            if ratio >= sensitivity or now - st['last_pass'] >= self.max_idle_s:
+                st['last_pass'] = now
+                self.stats['passed'] += 1
+                return True
+            self.stats['skipped'] += 1
+            return False
@@ -1,45 +1,150 @@
 # final-compre/app/processors/save_face.py
+import queue
+import threading
 from pathlib import Path
 import cv2
 from datetime import datetime
-from threading import Lock
 from config.paths import FACE_DIR  # Assume FACE_DIR is a Path object
-from config.logger_config import det_logger 
+from config.paths import FACE_CROP_FORMAT, FACE_CROP_QUALITY, FACE_CROP_WORKERS, FACE_CROP_QUEUE, FACE_CROP_POLICY
+from config.logger_config import det_logger
+
+class FaceCropWriter:
+    """
+    Small pool of threads that encodes and writes face crops off the
+    inference path. Crops arrive through a bounded queue; when the disk falls
+    behind, `policy` decides between dropping ('drop') and waiting up to
+    `block_timeout` seconds before dropping ('block').
+    """
+    def __init__(self, workers=2, max_queue=500, fmt="jpg", quality=90, policy="drop", block_timeout=0.2):
+        self.workers = max(1, workers)
+        self.fmt = fmt.lower().lstrip(".")
+        self.quality = int(quality)
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._dir_lock = threading.Lock()
+        self._known_dirs = set()   # directories already created, mkdir once per dir
+        self.counters = {'queued': 0, 'written': 0, 'dropped': 0, 'failed': 0}
+
+    @property
+    def extension(self):
+        return "webp" if self.fmt == "webp" else "jpg"
+
+    def _encode_params(self):
+        if self.extension == "webp":
+            return [cv2.IMWRITE_WEBP_QUALITY, self.quality]
+        return [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"face-crop-writer-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, path, crop):
+        """Queue a crop for writing; False if it was dropped."""
+        self._ensure_started()
+        try:
+            if self.policy == "block":
+                self._queue.put((path, crop), timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait((path, crop))
+        except queue.Full:
+            self.counters['dropped'] += 1
+            return False
+        self.counters['queued'] += 1
+        return True
+
+    def stats(self):
+        return dict(self.counters, queue_depth=self._queue.qsize(), queue_max=self._queue.maxsize)
+
+    def _ensure_dir(self, directory):
+        if directory in self._known_dirs:
+            return
+        with self._dir_lock:
+            if directory not in self._known_dirs:
+                directory.mkdir(parents=True, exist_ok=True)
+                self._known_dirs.add(directory)
+
+    def _run(self):
+        params = self._encode_params()
+        ext = f".{self.extension}"
+        while True:
+            path, crop = self._queue.get()
+            try:
+                ok, buf = cv2.imencode(ext, crop, params)
+                if not ok:
+                    raise ValueError("encode failed")
+                self._ensure_dir(path.parent)
+                with open(path, "wb") as fh:
+                    fh.write(buf.tobytes())
+                self.counters['written'] += 1
+            except Exception as e:
+                self.counters['failed'] += 1
+                det_logger.error(f"Failed to write face crop {path}: {e}")
+
+# shared by every camera
+crop_writer = FaceCropWriter(
+    workers=FACE_CROP_WORKERS,
+    max_queue=FACE_CROP_QUEUE,
+    fmt=FACE_CROP_FORMAT,
+    quality=FACE_CROP_QUALITY,
+    policy=FACE_CROP_POLICY
+)
+
+def scale_box(box, src_frame, dst_frame):
+    """Map a result box from src_frame's pixel grid onto dst_frame (same image, other size)."""
+    sy = dst_frame.shape[0] / src_frame.shape[0]
+    sx = dst_frame.shape[1] / src_frame.shape[1]
+    return dict(
+        box,
+        x_min=int(box['x_min'] * sx), x_max=int(round(box['x_max'] * sx)),
+        y_min=int(box['y_min'] * sy), y_max=int(round(box['y_max'] * sy))
+    )
 
 def save_image(frame, cam_id, box, subject, distance, is_unknown):
-    """Save the detected face as an image file and return its relative path."""
-    lock = Lock()
+    """Queue the detected face for saving and return its relative path right away."""
     face_dir = FACE_DIR  # FACE_DIR should be defined as your base folder for faces
     if is_unknown:
         subject = f"Un_{subject}"
     # Create a timestamp string
     timestamp = datetime.now().strftime('%y%m%d-%H:%M:%S-%f')[:-4]
-    
-    with lock:
-        face_image = frame[box['y_min']:box['y_max'], box['x_min']:box['x_max']]
-    
+
+    h, w = frame.shape[:2]
+    y_min, y_max = max(0, box['y_min']), min(h, box['y_max'])
+    x_min, x_max = max(0, box['x_min']), min(w, box['x_max'])
+    face_image = frame[y_min:y_max, x_min:x_max]
+
     if face_image is None or face_image.size == 0:
         print("Error: face_image is empty!")
         return "None_img"
-    
+
     # Create a file name for the saved face image
-    face_image_name = f"{distance}_{subject}_{cam_id}_{timestamp}_.jpg"
-    
+    face_image_name = f"{distance}_{subject}_{cam_id}_{timestamp}_.{crop_writer.extension}"
+
     # Determine the directory for the subject
     if is_unknown:
         subject_dir = face_dir / "Unknown"
     else:
         subject_dir = face_dir / subject
-    subject_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Save the image file
+
+    # Encoding and writing happen on the crop writer pool; the crop is copied
+    # because the frame buffer is reused by the caller
     face_image_path = subject_dir / face_image_name
-    cv2.imwrite(str(face_image_path), face_image)
-    
+    if not crop_writer.submit(face_image_path, face_image.copy()):
+        return "None_img"
+
     # Return the relative path with respect to FACE_DIR.
     # This might look like "subject/filename.jpg" or "Unknown/filename.jpg"
     relative_path = face_image_path.relative_to(face_dir)
     # Log the full image path for debugging purposes
     # det_logger.info(str(relative_path))
-    
+
     return str(relative_path)
@@ -6,4 +6,5 @@ bp = Blueprint('api', __name__)
 from app.routes.camera_routes import *
 from app.routes.other_route   import *
 from app.routes.subject_routes import *
+from app.routes.feed_socket   import *
 # … repeat for each file that declares routes on `bp` …
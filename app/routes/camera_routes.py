@@ -52,6 +52,21 @@ def stop_proc():
     else:
         return {'error' : 'Camera name not provided for stopping processing'}, 400
 
+@bp.route('/api/camera_roi', methods=['POST'])
+def camera_roi():
+    """Set (or clear with null) a camera's detection region."""
+    data = request.get_json()
+    camera_name = data.get('camera_name')
+    if not camera_name:
+        return {'error': 'Camera name not provided for setting roi'}, 400
+    response, status = camera_service.set_roi(camera_name, data.get('roi'))
+    return jsonify(response), status
+
+@bp.route('/api/camera_health', methods=['GET'])
+def camera_health():
+    """Uptime, reconnect counts and pending retries per camera."""
+    return jsonify(camera_service.camera_health()), 200
+
 @bp.route('/api/start_all_proc', methods=['GET'])
 def start_all_proc():
     """Start all cameras."""
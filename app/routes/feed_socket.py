@@ -0,0 +1,29 @@
+# app/routes/feed_socket.py
+from flask import request
+from flask_socketio import join_room, leave_room
+from app.extensions import socketio
+from app.services.live_feed import live_feed, feed_room
+
+# ─── live feed subscriptions (Socket.IO) ─────────────────────────────────
+@socketio.on('subscribe_feed')
+def subscribe_feed(data):
+    """Client wants 'frame-bin' events for one camera: { camera_name }"""
+    cam_name = (data or {}).get('camera_name')
+    if not cam_name:
+        return {'error': 'camera_name required'}
+    join_room(feed_room(cam_name))
+    live_feed.subscribe(request.sid, cam_name)
+    return {'message': f"Subscribed to '{cam_name}'"}
+
+@socketio.on('unsubscribe_feed')
+def unsubscribe_feed(data):
+    cam_name = (data or {}).get('camera_name')
+    if not cam_name:
+        return {'error': 'camera_name required'}
+    leave_room(feed_room(cam_name))
+    live_feed.unsubscribe(request.sid, cam_name)
+    return {'message': f"Unsubscribed from '{cam_name}'"}
+
+@socketio.on('disconnect')
+def feed_disconnect(*args):
+    live_feed.unsubscribe(request.sid)
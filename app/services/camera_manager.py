@@ -1,15 +1,22 @@
 # app/services/camera_manager.py
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import random
+import threading
 import time
 import pytz
 from sqlalchemy import and_
 from datetime import datetime, timedelta
 from app.models.model import Camera, CameraEvent, db
 from app.services.videocapture import VideoStream
+from app.services.live_feed import live_feed
 from config.state import vs_lock, frame_lock, feed_lock
 from config.logger_config import cam_stat_logger
+from config.paths import RECONNECT_ENABLE, RECONNECT_BASE_S, RECONNECT_MAX_S
+from config.paths import STARTUP_WORKERS, STARTUP_DEADLINE_S
 from sqlalchemy.exc import IntegrityError
 from app.utils.time_utils import now_utc, to_utc_iso, parse_iso, to_utc, now_local
+from app.utils.roi import roi_polygon, validate_roi
 from itertools import groupby
 
 # Removed duplicate _start_stream function, please use the method defined in CameraService.
@@ -21,6 +28,11 @@ class CameraService:
         self.vs_lock    = vs_lock
         self._vs_list   = {}     # name → VideoStream
         self.active_feed = None        
+        # stream health + background reconnection of cameras that died on their own
+        self._health    = defaultdict(lambda: {'started_at': None, 'reconnects': 0, 'failures': 0})
+        self._reconnect = {}     # name → {'attempts', 'next_try', 'down_since'}
+        self._reconnect_lock = threading.Lock()
+        self._rois      = {}     # name → ROI polygon of running cameras (read per AI frame)
         # the DB is the canonical source of truth for camera configs
 
     @property
@@ -29,20 +41,21 @@ class CameraService:
         with self.vs_lock:
             return dict(self._vs_list)
 
-    def _start_stream(self, name, source, attempts=7):
-        """Test and start a VideoStream for a camera."""
+    def _start_stream(self, name, source, attempts=7, timeout=None):
+        """Test and start a VideoStream for a camera (waits at most `timeout` s when given)."""
         vs = VideoStream(src=source)
         vs.start()
-        for i in range(attempts):
-            frame = vs.read()
-            if frame is not None:
-                cam_stat_logger.info(f"Camera {name} responded on attempt {i+1}.")
-                with self.vs_lock:
-                    self._vs_list[name] = vs
-                return True
-            time.sleep(0.5)
+        # wait for the first decoded frame instead of polling
+        start = time.monotonic()
+        wait = attempts * 0.5 if timeout is None else max(0.0, min(attempts * 0.5, timeout))
+        _, _, frame = vs.read_next(after_seq=0, timeout=wait)
+        if frame is not None:
+            cam_stat_logger.info(f"Camera {name} responded after {time.monotonic() - start:.2f}s.")
+            with self.vs_lock:
+                self._vs_list[name] = vs
+            return True
         vs.stop()
-        cam_stat_logger.error(f"Camera {name} failed to respond after {attempts} attempts.")
+        cam_stat_logger.error(f"Camera {name} failed to respond within {wait:.1f}s.")
         return False
 
     def _log_event(self, cam: Camera, event_type: str, action: str):
@@ -90,6 +103,14 @@ class CameraService:
         if not self._start_stream(name, cam.camera_url):
             cam_stat_logger.error(f"Camera {name} not responding")
             return {'error': f"Camera {name} not responding"}, 400
+        return self._on_started(cam, silent)
+
+    def _on_started(self, cam: Camera, silent=False):
+        """Bookkeeping once a camera's stream is up."""
+        name = cam.camera_name
+        self.cancel_reconnect(name)
+        self._health[name]['started_at'] = time.time()
+        self._rois[name] = roi_polygon(cam.roi)
 
         # only one lookup, then reuse `cam`
         # — before we log this new START, close out any lingering START w/o STOP
@@ -100,6 +121,58 @@ class CameraService:
 
         return {'message': f"Camera {name} started"}, 200
 
+    def _probe_streams(self, targets, deadline_s=STARTUP_DEADLINE_S, workers=STARTUP_WORKERS):
+        """
+        Start several streams concurrently: {name: url} → {name: bool}.
+        Every probe is cut to the time left before the shared deadline, so
+        the whole batch returns within roughly deadline_s however many
+        cameras are offline. No DB access here (worker threads).
+        """
+        if not targets:
+            return {}
+        deadline = time.monotonic() + deadline_s
+
+        def probe(name, url):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                return self._start_stream(name, url, timeout=remaining)
+            except Exception as e:
+                cam_stat_logger.error(f"Camera {name} probe failed: {e}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(targets))),
+                                thread_name_prefix="camera-probe") as pool:
+            futures = {name: pool.submit(probe, name, url) for name, url in targets.items()}
+            return {name: fut.result() for name, fut in futures.items()}
+
+    def _start_many(self, cams):
+        """
+        Probe the given Camera rows in parallel and log the ones that came up.
+        Unreachable cameras are handed to the reconnect supervisor instead of
+        holding up the caller. Returns {name: (response, status)}.
+        """
+        results, targets = {}, {}
+        for cam in cams:
+            if cam.camera_name in self._vs_list:
+                results[cam.camera_name] = ({'message': f"Camera {cam.camera_name} already started"}, 200)
+            else:
+                targets[cam.camera_name] = cam.camera_url
+
+        by_name = {cam.camera_name: cam for cam in cams}
+        for name, ok in self._probe_streams(targets).items():
+            if ok:
+                results[name] = self._on_started(by_name[name])
+            elif RECONNECT_ENABLE:
+                self._schedule_reconnect(name)
+                cam_stat_logger.warning(f"Camera {name} not responding at startup, retrying in background")
+                results[name] = ({'error': f"Camera {name} not responding, retrying in background"}, 202)
+            else:
+                cam_stat_logger.error(f"Camera {name} not responding")
+                results[name] = ({'error': f"Camera {name} not responding"}, 400)
+        return results
+
     def _close_open_period(self, cam: Camera, event_type: str):
         """
         If the last CameraEvent for this cam/event_type is a START with no STOP,
@@ -111,7 +184,7 @@ class CameraService:
             .order_by(CameraEvent.timestamp.desc())
             .first()
         )
-        if last and last.action == 'start':
+        if last and last.action in ('start', 'reconnect'):
             stop_evt = CameraEvent(
                 camera_id=cam.id,
                 event_type=event_type,
@@ -129,9 +202,14 @@ class CameraService:
             vs = self._vs_list.pop(name, None)
         if vs:
             vs.stop()
+        live_feed.forget(name)
+        if name in self._health:
+            self._health[name]['started_at'] = None
         return Camera.query.filter_by(camera_name=name).first()
 
     def stop_camera(self, name, silent=False):
+        # a deliberate stop also ends any pending reconnection
+        self.cancel_reconnect(name)
         cam = self._core_stop_operations(name)
         if not cam:
             cam_stat_logger.error(f"Camera {name} not found")
@@ -154,8 +232,102 @@ class CameraService:
             # Critical feed cleanup added
             if self.active_feed == name:
                 self.stop_feed()
+            self._health[name]['failures'] += 1
+            if RECONNECT_ENABLE:
+                self._schedule_reconnect(name)
         cam_stat_logger.warning(f"Camera {name} auto-stopped after missed frames")
 
+    # ─── reconnection ──────────────────────────────────────────────────
+    @staticmethod
+    def _backoff(attempts):
+        """Exponential delay capped at RECONNECT_MAX_S, jittered to 50–100% so cameras don't retry in lockstep."""
+        # 2**16 × base is far past any sane cap; keeps the power from overflowing a float
+        delay = min(RECONNECT_MAX_S, RECONNECT_BASE_S * (2 ** min(attempts, 16)))
+        return random.uniform(delay / 2, delay)
+
+    def _schedule_reconnect(self, name):
+        with self._reconnect_lock:
+            entry = self._reconnect.setdefault(
+                name, {'attempts': 0, 'next_try': 0.0, 'down_since': time.time()}
+            )
+            entry['next_try'] = time.monotonic() + self._backoff(entry['attempts'])
+
+    def cancel_reconnect(self, name):
+        with self._reconnect_lock:
+            self._reconnect.pop(name, None)
+
+    def _due_reconnects(self):
+        now = time.monotonic()
+        with self._reconnect_lock:
+            return [name for name, entry in self._reconnect.items() if entry['next_try'] <= now]
+
+    def _try_reconnect(self, name):
+        """One reconnection attempt; reschedules itself with a longer delay on failure."""
+        cam = Camera.query.filter_by(camera_name=name).first()
+        if not cam or name in self._vs_list:
+            # removed from the DB, or somebody started it meanwhile
+            self.cancel_reconnect(name)
+            return True
+        if self._start_stream(name, cam.camera_url):
+            with self._reconnect_lock:
+                entry = self._reconnect.pop(name, None)
+            self._rois[name] = roi_polygon(cam.roi)
+            health = self._health[name]
+            health['started_at'] = time.time()
+            health['reconnects'] += 1
+            self._log_event(cam, 'camera', 'reconnect')
+            attempts = entry['attempts'] + 1 if entry else 1
+            cam_stat_logger.info(f"Camera {name} reconnected after {attempts} attempt(s)")
+            return True
+        with self._reconnect_lock:
+            entry = self._reconnect.get(name)
+            if entry is None:
+                return False  # cancelled while we were probing
+            entry['attempts'] += 1
+            delay = self._backoff(entry['attempts'])
+            entry['next_try'] = time.monotonic() + delay
+        cam_stat_logger.warning(f"Camera {name} reconnect attempt {entry['attempts']} failed, next in {delay:.1f}s")
+        return False
+
+    def supervise(self, app, sleep=time.sleep, interval=1.0):
+        """Background task: retry cameras that stopped unexpectedly."""
+        while True:
+            for name in self._due_reconnects():
+                try:
+                    with app.app_context():
+                        self._try_reconnect(name)
+                except Exception as e:
+                    cam_stat_logger.error(f"Reconnect of camera {name} failed: {e}")
+                    with self._reconnect_lock:
+                        entry = self._reconnect.get(name)
+                        if entry is not None:
+                            # plain max delay here: nothing in this handler may raise
+                            entry['next_try'] = time.monotonic() + RECONNECT_MAX_S
+            sleep(interval)
+
+    def camera_health(self):
+        """Per-camera uptime, reconnect counts and pending retries."""
+        now, mono = time.time(), time.monotonic()
+        with self.vs_lock:
+            running = set(self._vs_list)
+        with self._reconnect_lock:
+            pending = {name: dict(entry) for name, entry in self._reconnect.items()}
+        health = {}
+        for name in running | set(pending) | set(self._health):
+            h = self._health[name]
+            entry = pending.get(name)
+            health[name] = {
+                'running':        name in running,
+                'uptime_s':       round(now - h['started_at'], 1) if h['started_at'] else 0.0,
+                'reconnects':     h['reconnects'],
+                'failures':       h['failures'],
+                'reconnecting':   entry is not None,
+                'retry_attempts': entry['attempts'] if entry else 0,
+                'next_retry_s':   round(max(0.0, entry['next_try'] - mono), 1) if entry else None,
+                'down_since':     to_utc_iso(datetime.fromtimestamp(entry['down_since'], pytz.utc)) if entry else None,
+            }
+        return health
+
     def remove_camera(self, name):
         """Remove camera record from DB and stop its stream."""
         cam = Camera.query.filter_by(camera_name=name).first()
@@ -199,6 +371,26 @@ class CameraService:
             resp, status = {'error': f"edit Camera {old_name} new name or tag not provided"}, 404 
         return resp, status
 
+    def get_roi(self, name):
+        """Detection ROI polygon (normalised) of a running camera, None = whole frame."""
+        return self._rois.get(name)
+
+    def set_roi(self, name, roi):
+        """Store a camera's detection ROI (rect or polygon, 0..1 coords; None clears it)."""
+        cam = Camera.query.filter_by(camera_name=name).first()
+        if not cam:
+            cam_stat_logger.error(f"Camera {name} not found in DB while setting roi")
+            return {'error': f"Camera {name} not found in DB"}, 404
+        try:
+            roi = validate_roi(roi)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        cam.roi = roi
+        db.session.commit()
+        self._rois[name] = roi_polygon(roi)
+        cam_stat_logger.info(f"Camera {name} roi set to {roi}")
+        return {'message': f"ROI updated for '{name}'", 'roi': roi}, 200
+
     def start_feed(self, name):
         cam = Camera.query.filter_by(camera_name=name).first()
         if not cam:
@@ -246,11 +438,11 @@ class CameraService:
             return len(self._vs_list)
     
     def start_all(self):
-        """Start all configured cameras."""
-        results = {}
-        for cam in Camera.query:
-            resp, st = self.start_camera(cam.camera_name)
-            results[cam.camera_name] = {'response': resp, 'status': st}
+        """Start all configured cameras (probed in parallel)."""
+        results = {
+            name: {'response': resp, 'status': st}
+            for name, (resp, st) in self._start_many(Camera.query.all()).items()
+        }
         cam_stat_logger.info(f"Start all  {results}")
         return results, 200
 
@@ -267,9 +459,35 @@ class CameraService:
         """
         On app‑startup only: read your env‑dict, add each to DB & spin up its stream.
         """
-        results = {}
+        results, to_start, existing = {}, [], set()
         for name, details in env_sources.items():
-            resp, st = self.add_camera(name, details['url'], details['tag'])
+            url, tag = details['url'], details['tag']
+            if not name or not url or not tag:
+                results[name] = {'status': 400, 'response': {'error': 'name, url, and tag are required'}}
+                continue
+            # rows are inserted one by one (cheap); only the stream probes run in parallel
+            db.session.add(Camera(camera_name=name, camera_url=url, tag=tag))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                existing.add(name)
+            cam = Camera.query.filter_by(camera_name=name).first()
+            if not cam:
+                # the conflict was not on the name (e.g. another row owns the URL)
+                cam_stat_logger.error(f"Camera {name} could not be added from env")
+                results[name] = {'status': 409, 'response': {'error': f"Camera '{name}' conflicts with an existing camera"}}
+                continue
+            if name in existing and cam.camera_url != url:
+                cam_stat_logger.warning(
+                    f"Camera {name} already exists with URL {cam.camera_url}; ignoring env URL {url}"
+                )
+            to_start.append(cam)
+
+        for name, (resp, st) in self._start_many(to_start).items():
+            if name in existing:
+                # same answer add_camera gives for a duplicate, stream started anyway
+                resp, st = {'error': f"Camera '{name}' already exists"}, 409
             results[name] = {'status': st, 'response': resp}
         cam_stat_logger.info(f"bootstrap_from_env {results}")
         return results, 200
@@ -283,7 +501,9 @@ class CameraService:
                 'camera_name': cam.camera_name,
                 'camera_url': cam.camera_url,
                 'tag': cam.tag,
-                'status': cam.camera_name in self._vs_list
+                'status': cam.camera_name in self._vs_list,
+                'reconnecting': cam.camera_name in self._reconnect,
+                'roi': cam.roi
             })
         return {'cameras': camera_list}, 200
 
@@ -343,7 +563,7 @@ class CameraService:
             def build_periods(evts, max_end):
                 periods, current = [], None
                 for e in evts:
-                    if e.action == 'start':
+                    if e.action in ('start', 'reconnect'):
                         current = e.timestamp
                     elif e.action == 'stop' and current:
                         periods.append({
@@ -0,0 +1,178 @@
+# app/services/detection_writer.py
+import queue
+import threading
+import time
+from sqlalchemy.exc import IntegrityError
+from app.models.model import db, Detection, Subject, Camera
+from app.utils.time_utils import now_utc
+from config.logger_config import det_logger
+from config.paths import DET_WRITER_QUEUE, DET_WRITER_BATCH, DET_WRITER_FLUSH_MS
+
+_STOP = object()
+
+class DetectionWriter:
+    """
+    Background writer for Detection rows.
+
+    Inference threads only enqueue plain dicts (never blocking: a full queue
+    drops the row and counts it). A single thread drains the queue, resolves
+    subject / camera ids from in-memory name maps and bulk-inserts every
+    `batch_size` rows or `flush_interval_ms`, whichever comes first.
+    """
+    def __init__(self, max_queue=5000, batch_size=200, flush_interval_ms=500):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self.app = None
+
+        # name → id / snapshot maps, owned by the writer thread
+        self._subjects = {}
+        self._cameras = {}
+        self._maps_loaded_at = 0.0
+
+        # bumped from every inference thread and the writer thread
+        self.counters = {'enqueued': 0, 'written': 0, 'dropped': 0, 'failed': 0, 'batches': 0}
+        self._counters_lock = threading.Lock()
+
+    def init_app(self, app):
+        """Call this once, after your Flask app is created, to start the writer thread."""
+        self.app = app
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="detection-writer", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, cam_name, subject_name, det_score, distance, det_face, is_unknown=False, timestamp=None):
+        """Queue one detection; returns False (and counts a drop) if the queue is full."""
+        row = {
+            'cam_name': cam_name,
+            'subject_name': None if is_unknown else subject_name,
+            'det_score': det_score,
+            'distance': distance,
+            'det_face': det_face,
+            'timestamp': timestamp or now_utc(),
+        }
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('enqueued')
+        return True
+
+    def _count(self, key, n=1):
+        with self._counters_lock:
+            self.counters[key] += n
+
+    def stats(self):
+        with self._counters_lock:
+            counters = dict(self.counters)
+        return dict(counters, queue_depth=self._queue.qsize(), queue_max=self._queue.maxsize)
+
+    def stop(self, timeout=5.0):
+        """Flush whatever is queued and stop the thread."""
+        if not self._thread or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    # ─── writer thread ─────────────────────────────────────────────────
+    def _run(self):
+        running = True
+        while running:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    running = False
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self._flush(batch)
+                except Exception as e:
+                    # e.g. DB unreachable while refreshing the maps; keep the thread alive
+                    det_logger.error(f"Detection writer flush error: {e}")
+                    self._count('failed', len(batch))
+
+    def _refresh_maps(self):
+        self._subjects = {
+            name: sid for sid, name in db.session.query(Subject.id, Subject.subject_name)
+        }
+        self._cameras = {
+            name: (cid, tag) for cid, name, tag in db.session.query(Camera.id, Camera.camera_name, Camera.tag)
+        }
+        self._maps_loaded_at = time.monotonic()
+
+    def _build_rows(self, batch):
+        rows = []
+        for item in batch:
+            subject_name = item['subject_name']
+            cam_id, cam_tag = self._cameras.get(item['cam_name'], (None, ''))
+            rows.append({
+                'subject_id':          self._subjects.get(subject_name) if subject_name else None,
+                'camera_id':           cam_id,
+                'legacy_subject_name': subject_name or 'Unknown',
+                'legacy_camera_name':  item['cam_name'],
+                'legacy_camera_tag':   cam_tag,
+                'det_score':           item['det_score'],
+                'distance':            item['distance'],
+                'timestamp':           item['timestamp'],
+                'det_face':            item['det_face'],
+            })
+        return rows
+
+    def _has_unknown_names(self, batch):
+        return any(
+            (item['subject_name'] and item['subject_name'] not in self._subjects)
+            or item['cam_name'] not in self._cameras
+            for item in batch
+        )
+
+    def _flush(self, batch):
+        with self.app.app_context():
+            # new subject / camera (or a rename) → one map refresh, at most once a second
+            if not self._maps_loaded_at or (
+                self._has_unknown_names(batch) and time.monotonic() - self._maps_loaded_at > 1.0
+            ):
+                self._refresh_maps()
+
+            for attempt in range(2):
+                try:
+                    # executemany: one round-trip batch instead of add/commit per row
+                    db.session.execute(Detection.__table__.insert(), self._build_rows(batch))
+                    db.session.commit()
+                    with self._counters_lock:
+                        self.counters['written'] += len(batch)
+                        self.counters['batches'] += 1
+                    return
+                except IntegrityError as e:
+                    # most likely a subject/camera deleted since the maps were loaded
+                    db.session.rollback()
+                    if attempt == 0:
+                        self._refresh_maps()
+                        continue
+                    det_logger.error(f"Detection batch of {len(batch)} rejected: {e}")
+                except Exception as e:
+                    db.session.rollback()
+                    det_logger.error(f"Detection batch of {len(batch)} failed: {e}")
+                    break
+            self._count('failed', len(batch))
+
+# module‑level singleton
+detection_writer = DetectionWriter(
+    max_queue=DET_WRITER_QUEUE,
+    batch_size=DET_WRITER_BATCH,
+    flush_interval_ms=DET_WRITER_FLUSH_MS
+)
@@ -0,0 +1,408 @@
+# app/services/embedding_gallery.py
+import threading
+from collections import namedtuple
+import numpy as np
+from app.models.model import db, Embedding, Subject
+from app.utils.embedding_codec import decode_embeddings
+from app.services.gallery_index import BruteForceIndex, IndexStore, make_index, recall_check
+from custom_service.insightface_bundle.verify_euclidean_dis import normalize_rows, top_matches
+from config.logger_config import face_proc_logger
+from config.paths import GALLERY_INDEX, GALLERY_INDEX_MIN, GALLERY_INDEX_DIR, GALLERY_RECALL_SAMPLE
+from config.paths import GALLERY_MATCH_MODE, GALLERY_CENTROID_CANDIDATES
+
+EMBEDDING_DIM = 512
+
+# One immutable snapshot of the gallery; swapped atomically on every change.
+# Rows are sorted by label, the int64 key the search index reports back.
+GalleryState = namedtuple(
+    'GalleryState',
+    ['matrix', 'labels', 'embedding_ids', 'subject_ids', 'subject_names', 'index', 'subjects']
+)
+
+# Per-subject aggregates for the centroid match modes: row i of `centroids`
+# is the re-normalized mean of subject i's embeddings, whose rows in the
+# gallery matrix are order[bounds[i]:bounds[i + 1]].
+SubjectGroups = namedtuple(
+    'SubjectGroups', ['centroids', 'subject_ids', 'subject_names', 'order', 'bounds']
+)
+
+MATCH_MODES = ('embedding', 'centroid', 'centroid_max')
+
+def _empty_state(dim, index=None):
+    return GalleryState(
+        matrix=np.empty((0, dim), dtype=np.float32),
+        labels=np.empty(0, dtype=np.int64),
+        embedding_ids=np.empty(0, dtype=object),
+        subject_ids=np.empty(0, dtype=object),
+        subject_names=np.empty(0, dtype=object),
+        index=index if index is not None else BruteForceIndex(dim),
+        subjects=None,
+    )
+
+def subject_groups(matrix, subject_ids, subject_names):
+    """Group the gallery rows by subject and compute one centroid per subject."""
+    slot = {}
+    inverse = np.fromiter(
+        (slot.setdefault(sid, len(slot)) for sid in subject_ids), dtype=np.int64, count=len(subject_ids)
+    )
+    if len(slot) == 0:
+        return SubjectGroups(np.empty((0, matrix.shape[1]), dtype=np.float32),
+                             np.empty(0, dtype=object), np.empty(0, dtype=object),
+                             np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64))
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.searchsorted(inverse[order], np.arange(len(slot) + 1))
+    centroids = normalize_rows(np.add.reduceat(matrix[order], bounds[:-1], axis=0))
+    first = order[bounds[:-1]]
+    return SubjectGroups(centroids, subject_ids[first], subject_names[first], order, bounds)
+
+class EmbeddingGallery:
+    """
+    Process-wide, in-memory copy of every enrolled embedding.
+
+    Holds a pre-normalized float32 (N, 512) matrix plus parallel
+    embedding-id / subject-id / subject-name arrays, so matching a whole
+    frame of faces is a single matrix product instead of a DB query and a
+    Python loop per face.
+
+    Writers (SubjectService) publish add/remove/rename deltas; they are
+    queued and merged into a new snapshot by the next match() call, so a
+    bulk enrollment patches the gallery in a few merges instead of
+    reloading it from the DB once per subject.
+
+    The search itself goes through a pluggable index (GALLERY_INDEX: exact
+    brute force, numpy IVF, faiss or hnswlib), patched in place with the
+    same deltas and saved under GALLERY_INDEX_DIR so restarts skip the
+    training.
+
+    GALLERY_MATCH_MODE switches to per-subject matching: 'centroid' scores
+    every subject by its mean embedding only, 'centroid_max' shortlists
+    the closest centroids and rescores those subjects by their best
+    individual embedding (max similarity over their images).
+    """
+    def __init__(self, dim=EMBEDDING_DIM, index_kind=GALLERY_INDEX, index_dir=GALLERY_INDEX_DIR,
+                 match_mode=GALLERY_MATCH_MODE, centroid_candidates=GALLERY_CENTROID_CANDIDATES):
+        self.dim = dim
+        self.index_kind = index_kind
+        if match_mode not in MATCH_MODES:
+            face_proc_logger.warning(f"Unknown GALLERY_MATCH_MODE {match_mode!r}, using 'embedding'")
+            match_mode = 'embedding'
+        self.match_mode = match_mode
+        self.centroid_candidates = max(1, centroid_candidates)
+        self._store = IndexStore(str(index_dir))
+        self._load_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending = []       # queued ('add'|'remove'|'rename', payload) deltas
+        self._state = _empty_state(dim)
+        self._next_label = 0
+        self._save_lock = threading.Lock()
+        self._save_dirty = False
+        self._saving = False
+        self.last_recall = None
+        self.loaded = False
+
+    def init_app(self, app):
+        """Call this once, after your Flask app is created, to load from DB."""
+        with app.app_context():
+            self.reload()
+
+    def reload(self):
+        """Full rebuild from the DB (startup / model change only)."""
+        with self._load_lock:
+            # anything published before this query is already in the DB rows
+            with self._pending_lock:
+                self._pending = []
+            rows = (
+                db.session.query(
+                    Embedding.id, Embedding.embedding, Subject.id, Subject.subject_name
+                )
+                .join(Subject, Embedding.subject_id == Subject.id)
+                .all()
+            )
+            # centroid modes only scan per-image rows for a short list of subjects
+            kind = self.index_kind if self.match_mode == 'embedding' else 'brute'
+            index = make_index(kind, self.dim, len(rows), GALLERY_INDEX_MIN)
+            meta = self._store.load_meta() if index.persistent else None
+            labels, self._next_label = self._labels_for([r[0] for r in rows], meta)
+            # keep rows in label order so match() can map labels back with searchsorted
+            order = np.argsort(labels, kind='stable')
+            rows = [rows[i] for i in order]
+            labels = labels[order]
+            if rows:
+                matrix = normalize_rows(decode_embeddings([r[1] for r in rows], self.dim))
+            else:
+                matrix = np.empty((0, self.dim), dtype=np.float32)
+
+            restored = index.persistent and self._store.restore(index, meta, matrix, labels)
+            if not restored:
+                index.build(matrix, labels)
+            state = self._with_subjects(GalleryState(
+                matrix=matrix,
+                labels=labels,
+                embedding_ids=np.array([r[0] for r in rows], dtype=object),
+                subject_ids=np.array([r[2] for r in rows], dtype=object),
+                subject_names=np.array([r[3] for r in rows], dtype=object),
+                index=index,
+                subjects=None,
+            ))
+            self._state = state
+            self.loaded = True
+        face_proc_logger.info(
+            f"Embedding gallery loaded with {len(state.embedding_ids)} embeddings "
+            f"({index.kind} index, {'restored' if restored else 'built'})"
+        )
+        if index.persistent and (not restored or not np.array_equal(np.sort(meta['labels']), labels)):
+            self._save_async()
+        if not isinstance(index, BruteForceIndex):
+            self.check_recall()
+
+    def _with_subjects(self, state):
+        """Attach the per-subject centroids when a centroid mode is active."""
+        if self.match_mode == 'embedding':
+            return state
+        return state._replace(subjects=subject_groups(state.matrix, state.subject_ids, state.subject_names))
+
+    @staticmethod
+    def _labels_for(embedding_ids, meta):
+        """
+        Reuse the stored label of every embedding still present so a saved
+        index stays valid; new embeddings continue from the stored label
+        counter, so a label freed by a deletion is never reused.
+        Returns (labels, next free label).
+        """
+        known, next_label = {}, 0
+        if meta is not None:
+            known = dict(zip(meta['embedding_ids'].tolist(), meta['labels'].tolist()))
+            next_label = max(meta['next_label'], max(known.values(), default=-1) + 1)
+        labels = []
+        for emb_id in embedding_ids:
+            label = known.get(str(emb_id))
+            if label is None:
+                label = next_label
+                next_label += 1
+            labels.append(label)
+        return np.array(labels, dtype=np.int64), next_label
+
+    def ensure_loaded(self):
+        """Lazy fallback for callers that run before init_app (needs an app context)."""
+        if not self.loaded:
+            self.reload()
+
+    # ─── incremental updates ─────────────────────────────────────────────
+    def publish_add(self, entries):
+        """
+        Queue new embeddings.
+        entries: iterable of (embedding_id, subject_id, subject_name, vector).
+        """
+        entries = list(entries)
+        if entries:
+            self._publish('add', entries)
+
+    def publish_remove(self, embedding_ids=None, subject_ids=None):
+        """Queue removal of specific embeddings and/or every embedding of some subjects."""
+        embedding_ids = set(embedding_ids or ())
+        subject_ids = set(subject_ids or ())
+        if embedding_ids or subject_ids:
+            self._publish('remove', (embedding_ids, subject_ids))
+
+    def publish_rename(self, subject_id, subject_name):
+        """Queue a subject rename so matches report the new name."""
+        self._publish('rename', (subject_id, subject_name))
+
+    def _publish(self, kind, payload):
+        with self._pending_lock:
+            self._pending.append((kind, payload))
+
+    def _apply_pending(self):
+        """Merge all queued deltas into one new snapshot (no DB access)."""
+        if not self._pending:
+            return
+        with self._load_lock:
+            with self._pending_lock:
+                deltas, self._pending = self._pending, []
+            if not deltas:
+                return
+            try:
+                self._merge(deltas)
+            except Exception:
+                # put the deltas back in front of anything queued meanwhile
+                with self._pending_lock:
+                    self._pending = deltas + self._pending
+                raise
+        face_proc_logger.info(
+            f"Embedding gallery patched with {len(deltas)} deltas, now {len(self._state.embedding_ids)} embeddings"
+        )
+        if self._state.index.persistent:
+            self._save_async()
+
+    def _merge(self, deltas):
+        """Build the next snapshot from `deltas`; caller holds _load_lock."""
+        state = self._state
+        matrix = [state.matrix]
+        labels = [state.labels]
+        embedding_ids = list(state.embedding_ids)
+        subject_ids = list(state.subject_ids)
+        subject_names = list(state.subject_names)
+        keep = [True] * len(embedding_ids)
+
+        for kind, payload in deltas:
+            if kind == 'add':
+                vectors = normalize_rows(np.stack([e[3] for e in payload]))
+                matrix.append(vectors)
+                labels.append(np.arange(self._next_label, self._next_label + len(payload), dtype=np.int64))
+                self._next_label += len(payload)
+                for emb_id, subj_id, subj_name, _ in payload:
+                    embedding_ids.append(emb_id)
+                    subject_ids.append(subj_id)
+                    subject_names.append(subj_name)
+                    keep.append(True)
+            elif kind == 'remove':
+                rm_embs, rm_subjects = payload
+                for i, (emb_id, subj_id) in enumerate(zip(embedding_ids, subject_ids)):
+                    if emb_id in rm_embs or subj_id in rm_subjects:
+                        keep[i] = False
+            elif kind == 'rename':
+                subj_id, subj_name = payload
+                for i, existing in enumerate(subject_ids):
+                    if existing == subj_id:
+                        subject_names[i] = subj_name
+
+        keep = np.array(keep, dtype=bool)
+        matrix = np.vstack(matrix)
+        labels = np.concatenate(labels)
+        index = state.index
+        if isinstance(index, BruteForceIndex):
+            index.build(matrix[keep], labels[keep])
+        else:
+            old = len(state.labels)
+            removed = labels[:old][~keep[:old]]
+            if len(removed):
+                index.remove(removed)
+            added = np.flatnonzero(keep[old:]) + old
+            if len(added):
+                index.add(matrix[added], labels[added])
+        self._state = self._with_subjects(GalleryState(
+            matrix=matrix[keep],
+            labels=labels[keep],
+            embedding_ids=np.array(embedding_ids, dtype=object)[keep],
+            subject_ids=np.array(subject_ids, dtype=object)[keep],
+            subject_names=np.array(subject_names, dtype=object)[keep],
+            index=index,
+            subjects=None,
+        ))
+
+    # ─── index persistence / quality ─────────────────────────────────────
+    def _save_async(self):
+        """Save the index in the background; saves requested meanwhile collapse into one."""
+        with self._save_lock:
+            self._save_dirty = True
+            if self._saving:
+                return
+            self._saving = True
+        threading.Thread(target=self._save_loop, daemon=True, name="gallery-index-save").start()
+
+    def _save_loop(self):
+        while True:
+            with self._save_lock:
+                if not self._save_dirty:
+                    self._saving = False
+                    return
+                self._save_dirty = False
+            try:
+                # copy the index under the lock so no patch lands between it
+                # and its label map; the disk write happens without the lock
+                with self._load_lock:
+                    state = self._state
+                    snapshot = state.index.snapshot() if state.index.persistent else None
+                    next_label = self._next_label
+                self._store.save(state.index, snapshot, state.labels, state.embedding_ids, next_label)
+            except Exception as e:
+                face_proc_logger.error(f"Failed to save gallery index: {e}")
+
+    def check_recall(self, sample=GALLERY_RECALL_SAMPLE, top_n=10):
+        """Recall@top_n and per-query latency of the index vs. exact brute force."""
+        state = self._state
+        result = recall_check(state.index, state.matrix, state.labels, sample=sample, top_n=top_n)
+        if result is not None:
+            self.last_recall = result
+            face_proc_logger.info(f"Gallery index recall check: {result}")
+        return result
+
+    def stats(self):
+        state = self._state
+        return {
+            "embeddings": len(state.embedding_ids),
+            "subjects":   len(state.subjects.subject_ids) if state.subjects is not None else None,
+            "match_mode": self.match_mode,
+            "index":      state.index.kind,
+            "recall":     self.last_recall,
+        }
+
+    def __len__(self):
+        return len(self._state.embedding_ids)
+
+    def match(self, embeddings, top_n=1):
+        """
+        Match a batch of query embeddings against the gallery.
+
+        embeddings: (M, D) array (or a single (D,) vector).
+        Returns a list of M lists, each holding up to top_n
+        {'subject_name', 'subject_id', 'distance'} dicts, closest first.
+        """
+        self.ensure_loaded()
+        self._apply_pending()
+        state = self._state
+        queries = normalize_rows(embeddings)
+        if len(state.labels) == 0:
+            return [[] for _ in range(len(queries))]
+        if state.subjects is not None:
+            return self._match_subjects(state, queries, top_n)
+        labels, distances = state.index.search(queries, top_n)
+        # in-place indexes may already hold rows of a newer snapshot: drop
+        # labels this snapshot doesn't know (and -1 padding)
+        positions = np.minimum(np.searchsorted(state.labels, labels), len(state.labels) - 1)
+        valid = (labels >= 0) & (state.labels[positions] == labels)
+
+        results = []
+        for row_pos, row_dist, row_valid in zip(positions, distances, valid):
+            results.append([
+                {
+                    'subject_name': state.subject_names[i],
+                    'subject_id':   state.subject_ids[i],
+                    'distance':     float(d)
+                }
+                for i, d, ok in zip(row_pos, row_dist, row_valid) if ok
+            ])
+        return results
+
+    def _match_subjects(self, state, queries, top_n):
+        """
+        Centroid modes: one result per subject. The centroids shortlist
+        max(top_n, centroid_candidates) subjects; 'centroid_max' then
+        rescores each of them by its closest individual embedding.
+        """
+        groups = state.subjects
+        shortlist = max(top_n, self.centroid_candidates) if self.match_mode == 'centroid_max' else top_n
+        idx, distances = top_matches(queries, groups.centroids, top_n=shortlist)
+
+        results = []
+        for q, (subj_idx, subj_dist) in enumerate(zip(idx, distances)):
+            if self.match_mode == 'centroid_max' and len(subj_idx):
+                rows = [groups.order[groups.bounds[i]:groups.bounds[i + 1]] for i in subj_idx]
+                sims = state.matrix[np.concatenate(rows)] @ queries[q]
+                starts = np.cumsum([0] + [len(r) for r in rows[:-1]])
+                best = np.maximum.reduceat(sims, starts)
+                rank = np.argsort(-best)[:top_n]
+                subj_idx = subj_idx[rank]
+                subj_dist = np.sqrt(np.clip(2.0 - 2.0 * best[rank], 0.0, None))
+            results.append([
+                {
+                    'subject_name': groups.subject_names[i],
+                    'subject_id':   groups.subject_ids[i],
+                    'distance':     float(d)
+                }
+                for i, d in zip(subj_idx, subj_dist)
+            ])
+        return results
+
+# module‑level singleton shared by the recognition pipeline
+embedding_gallery = EmbeddingGallery()
@@ -0,0 +1,122 @@
+# app/services/frame_pump.py
+import threading
+import time
+from config.logger_config import cam_stat_logger
+from config.paths import PUMP_MAX_FPS, STREAM_STALE_S
+
+class CameraPump(threading.Thread):
+    """
+    Feeds one camera's fresh frames to processing.
+
+    Blocks on the stream's new-frame notification (no polling, no shared
+    lock), submits at most `max_fps` frames per second and reports the
+    stream as dead once no new frame arrived for `stale_after` seconds.
+    """
+    def __init__(self, cam_name, vs, submit, on_stale, max_fps=25.0, stale_after=3.0):
+        super().__init__(name=f"frame-pump-{cam_name}", daemon=True)
+        self.cam_name = cam_name
+        self.vs = vs
+        self.submit = submit
+        self.on_stale = on_stale
+        self.stale_after = stale_after
+        self.set_rate(max_fps)
+        self._stop_evt = threading.Event()
+        self.stats = {'submitted': 0, 'skipped': 0, 'stale': False}
+
+    def set_rate(self, max_fps):
+        self.max_fps = max_fps
+        self.interval = 1.0 / max_fps if max_fps and max_fps > 0 else 0.0
+
+    def stop(self):
+        self._stop_evt.set()
+
+    def run(self):
+        last_seq = 0
+        next_due = 0.0
+        while not self._stop_evt.is_set():
+            # per-camera rate limit: sleep off the rest of the interval,
+            # then take whatever frame is newest at that point
+            wait = next_due - time.monotonic()
+            if wait > 0 and self._stop_evt.wait(wait):
+                break
+
+            seq, captured_at, frame = self.vs.read_next(after_seq=last_seq, timeout=self.stale_after)
+            if self._stop_evt.is_set():
+                break
+            if frame is None:
+                # timed out or the decoder exited → frozen / dead stream
+                self.stats['stale'] = True
+                self.on_stale(self.cam_name, self.vs)
+                break
+
+            if last_seq and seq > last_seq + 1:
+                self.stats['skipped'] += seq - last_seq - 1
+            last_seq = seq
+            next_due = time.monotonic() + self.interval
+            # matching high-res frame for crops, when the stream has one
+            hires = self.vs.read_hires(seq) if self.vs.hires_size else None
+            self.submit(self.cam_name, frame, captured_at, hires)
+            self.stats['submitted'] += 1
+
+class FramePump:
+    """
+    Keeps one CameraPump per running stream.
+
+    `run()` only reconciles the set of pump threads with the running streams
+    every `sync_interval` seconds; frames themselves never pass through it.
+    """
+    def __init__(self, max_fps=25.0, stale_after=3.0, sync_interval=0.5):
+        self.max_fps = max_fps
+        self.stale_after = stale_after
+        self.sync_interval = sync_interval
+        self.rates = {}           # cam_name → max fps override
+        self._pumps = {}          # cam_name → CameraPump
+        self._lock = threading.Lock()
+
+    def set_rate(self, cam_name, max_fps):
+        """Change one camera's pump rate (None → back to the default)."""
+        with self._lock:
+            if max_fps is None:
+                self.rates.pop(cam_name, None)
+            else:
+                self.rates[cam_name] = max_fps
+            pump = self._pumps.get(cam_name)
+        if pump:
+            pump.set_rate(self.rates.get(cam_name, self.max_fps))
+
+    def sync(self, streams, submit, on_stale):
+        """Start pumps for new streams, stop pumps whose stream went away or was replaced."""
+        with self._lock:
+            for cam_name, pump in list(self._pumps.items()):
+                if streams.get(cam_name) is not pump.vs or not pump.is_alive():
+                    pump.stop()
+                    del self._pumps[cam_name]
+            for cam_name, vs in streams.items():
+                if cam_name in self._pumps:
+                    continue
+                pump = CameraPump(
+                    cam_name, vs, submit, on_stale,
+                    max_fps=self.rates.get(cam_name, self.max_fps),
+                    stale_after=self.stale_after
+                )
+                self._pumps[cam_name] = pump
+                pump.start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                cam: dict(pump.stats, max_fps=pump.max_fps)
+                for cam, pump in self._pumps.items()
+            }
+
+    def run(self, get_streams, submit, on_stale, sleep=time.sleep):
+        """Background task: keep the pump threads in line with the running cameras."""
+        while True:
+            try:
+                self.sync(get_streams(), submit, on_stale)
+            except Exception as e:
+                cam_stat_logger.error(f"Frame pump sync error: {e}")
+            sleep(self.sync_interval)
+
+# module‑level singleton
+frame_pump = FramePump(max_fps=PUMP_MAX_FPS, stale_after=STREAM_STALE_S)
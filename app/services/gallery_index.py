@@ -0,0 +1,505 @@
+# app/services/gallery_index.py
+import importlib.util
+import os
+import pickle
+import threading
+import time
+import uuid
+import numpy as np
+from custom_service.insightface_bundle.verify_euclidean_dis import normalize_rows, top_matches
+from config.logger_config import face_proc_logger
+from config.paths import (
+    GALLERY_IVF_NLIST, GALLERY_IVF_NPROBE, GALLERY_HNSW_M, GALLERY_HNSW_EF, GALLERY_HNSW_EF_BUILD
+)
+
+# Every index stores L2-normalized float32 rows under int64 labels and
+# answers search(queries, k) with (labels, distances), both (M, k), closest
+# first, padded with label -1 / distance inf when fewer than k were found.
+# Distances are the Euclidean sqrt(2 - 2cos) used everywhere else.
+# Persistent indexes save in two steps: snapshot() takes a consistent
+# in-memory copy (cheap, done under the gallery lock) and
+# write_snapshot(snapshot, path) puts it on disk without any lock held.
+
+def _distances(sims):
+    return np.sqrt(np.clip(2.0 - 2.0 * sims, 0.0, None)).astype(np.float32)
+
+def _empty_result(m):
+    return np.empty((m, 0), dtype=np.int64), np.empty((m, 0), dtype=np.float32)
+
+def has_library(name):
+    return importlib.util.find_spec(name) is not None
+
+class BruteForceIndex:
+    """Exact scan: one matrix product over every stored vector."""
+    kind = 'brute'
+    persistent = False   # nothing to gain from saving a plain matrix
+
+    def __init__(self, dim):
+        self.dim = dim
+        self._data = (np.empty((0, dim), dtype=np.float32), np.empty(0, dtype=np.int64))
+
+    def __len__(self):
+        return len(self._data[1])
+
+    def build(self, vectors, labels):
+        # keeps a reference, the gallery snapshot owns the matrix
+        self._data = (np.asarray(vectors, dtype=np.float32), np.asarray(labels, dtype=np.int64))
+
+    def add(self, vectors, labels):
+        matrix, stored = self._data
+        self._data = (np.vstack([matrix, vectors]), np.concatenate([stored, labels]))
+
+    def remove(self, labels):
+        matrix, stored = self._data
+        keep = ~np.isin(stored, labels)
+        self._data = (matrix[keep], stored[keep])
+
+    def search(self, queries, k):
+        matrix, stored = self._data
+        idx, distances = top_matches(queries, matrix, top_n=k)
+        return stored[idx], distances
+
+class IVFIndex:
+    """
+    Pure-numpy IVF-Flat. Vectors are bucketed by their nearest of `nlist`
+    spherical k-means centroids (0 → sqrt(N)) and a query only scans its
+    `nprobe` closest buckets: raise nprobe for recall, lower it for speed.
+    Copy-on-write like the gallery itself, so searches need no lock.
+    """
+    kind = 'ivf'
+    persistent = True
+
+    def __init__(self, dim, nlist=0, nprobe=16, train_iters=10, seed=0):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_iters = train_iters
+        self.seed = seed
+        self._data = (None, ())   # (centroids, ((vectors, labels) per bucket))
+
+    def __len__(self):
+        return sum(len(labels) for _, labels in self._data[1])
+
+    def _train(self, vectors):
+        n = len(vectors)
+        nlist = min(self.nlist or max(1, int(round(np.sqrt(n)))), n)
+        rng = np.random.default_rng(self.seed)
+        sample = vectors[rng.choice(n, min(n, 40 * nlist), replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.train_iters):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            empty = np.bincount(assign, minlength=nlist) == 0
+            if empty.any():
+                # re-seed dead buckets from random points
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = normalize_rows(sums)
+        return centroids
+
+    @staticmethod
+    def _assign(centroids, vectors, chunk=16384):
+        if len(vectors) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([
+            np.argmax(vectors[i:i + chunk] @ centroids.T, axis=1)
+            for i in range(0, len(vectors), chunk)
+        ])
+
+    def _buckets(self, centroids, vectors, labels):
+        assign = self._assign(centroids, vectors)
+        order = np.argsort(assign, kind='stable')
+        bounds = np.searchsorted(assign[order], np.arange(len(centroids) + 1))
+        return tuple(
+            (vectors[order[a:b]], labels[order[a:b]]) for a, b in zip(bounds[:-1], bounds[1:])
+        )
+
+    def build(self, vectors, labels):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        labels = np.asarray(labels, dtype=np.int64)
+        if len(vectors) == 0:
+            self._data = (None, ())
+            return
+        centroids = self._train(vectors)
+        self._data = (centroids, self._buckets(centroids, vectors, labels))
+
+    def add(self, vectors, labels):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        labels = np.asarray(labels, dtype=np.int64)
+        centroids, buckets = self._data
+        if centroids is None:
+            self.build(vectors, labels)
+            return
+        assign = self._assign(centroids, vectors)
+        buckets = list(buckets)
+        for c in np.unique(assign):
+            mask = assign == c
+            bucket_vectors, bucket_labels = buckets[c]
+            buckets[c] = (np.vstack([bucket_vectors, vectors[mask]]),
+                          np.concatenate([bucket_labels, labels[mask]]))
+        self._data = (centroids, tuple(buckets))
+
+    def remove(self, labels):
+        centroids, buckets = self._data
+        updated = []
+        for bucket_vectors, bucket_labels in buckets:
+            keep = ~np.isin(bucket_labels, labels)
+            updated.append((bucket_vectors, bucket_labels) if keep.all()
+                           else (bucket_vectors[keep], bucket_labels[keep]))
+        self._data = (centroids, tuple(updated))
+
+    def search(self, queries, k):
+        centroids, buckets = self._data
+        if centroids is None or k <= 0:
+            return _empty_result(len(queries))
+        out_labels = np.full((len(queries), k), -1, dtype=np.int64)
+        out_dist = np.full((len(queries), k), np.inf, dtype=np.float32)
+        nprobe = min(self.nprobe, len(centroids))
+        probes = np.argsort(-(queries @ centroids.T), axis=1)[:, :nprobe]
+        for q, cells in enumerate(probes):
+            cells = [c for c in cells if len(buckets[c][1])]
+            if not cells:
+                continue
+            sims = np.concatenate([buckets[c][0] @ queries[q] for c in cells])
+            labels = np.concatenate([buckets[c][1] for c in cells])
+            n = min(k, len(sims))
+            top = np.argpartition(-sims, n - 1)[:n] if n < len(sims) else np.arange(len(sims))
+            top = top[np.argsort(-sims[top])]
+            out_labels[q, :n] = labels[top]
+            out_dist[q, :n] = _distances(sims[top])
+        return out_labels, out_dist
+
+    def snapshot(self):
+        # centroids are never modified in place, the reference is enough
+        centroids = self._data[0]
+        return centroids if centroids is not None else np.empty((0, self.dim), dtype=np.float32)
+
+    @staticmethod
+    def write_snapshot(snapshot, path):
+        with open(path, 'wb') as f:
+            np.savez(f, centroids=snapshot)
+
+    def restore(self, path, vectors, labels, stored_labels):
+        """Reuse the trained centroids; the buckets are re-filled from the current vectors."""
+        with np.load(path) as z:
+            centroids = z['centroids'].astype(np.float32)
+        if centroids.shape[1:] != (self.dim,) or len(centroids) == 0:
+            raise ValueError("stored IVF centroids do not fit this gallery")
+        if self.nlist and self.nlist != len(centroids):
+            raise ValueError("GALLERY_IVF_NLIST changed, retraining")
+        self._data = (centroids, self._buckets(centroids, np.asarray(vectors, dtype=np.float32),
+                                               np.asarray(labels, dtype=np.int64)))
+
+def _reconcile(index, vectors, labels, stored_labels):
+    """Bring a loaded index in line with the current rows (drop deleted, add new)."""
+    labels = np.asarray(labels, dtype=np.int64)
+    stored_labels = np.asarray(stored_labels, dtype=np.int64)
+    gone = stored_labels[~np.isin(stored_labels, labels)]
+    new = ~np.isin(labels, stored_labels)
+    if len(gone):
+        index.remove(gone)
+    if new.any():
+        index.add(np.asarray(vectors, dtype=np.float32)[new], labels[new])
+    return len(gone), int(new.sum())
+
+class FaissIndex:
+    """
+    faiss IVF-Flat on inner product (exact flat index while the gallery is
+    too small to train `nlist` lists). nprobe is the recall/latency knob.
+    """
+    kind = 'faiss'
+    persistent = True
+
+    def __init__(self, dim, nlist=0, nprobe=16):
+        import faiss
+        self.faiss = faiss
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+    def __len__(self):
+        return self._index.ntotal
+
+    def _set_nprobe(self, index):
+        try:
+            self.faiss.extract_index_ivf(index).nprobe = self.nprobe
+        except RuntimeError:
+            pass   # flat index, nothing to probe
+
+    def build(self, vectors, labels):
+        faiss = self.faiss
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        labels = np.asarray(labels, dtype=np.int64)
+        nlist = min(self.nlist or int(round(np.sqrt(len(vectors)))), len(vectors) // 39)
+        if nlist >= 2:
+            quantizer = faiss.IndexFlatIP(self.dim)
+            index = faiss.IndexIVFFlat(quantizer, self.dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(vectors)
+            self._set_nprobe(index)
+        else:
+            index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+        if len(vectors):
+            index.add_with_ids(vectors, labels)
+        with self._lock:
+            self._index = index
+
+    def add(self, vectors, labels):
+        with self._lock:
+            self._index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32),
+                                     np.asarray(labels, dtype=np.int64))
+
+    def remove(self, labels):
+        with self._lock:
+            self._index.remove_ids(np.asarray(labels, dtype=np.int64))
+
+    def search(self, queries, k):
+        with self._lock:
+            if self._index.ntotal == 0 or k <= 0:
+                return _empty_result(len(queries))
+            sims, labels = self._index.search(np.ascontiguousarray(queries, dtype=np.float32), k)
+        distances = _distances(sims)
+        distances[labels < 0] = np.inf
+        return labels.astype(np.int64), distances
+
+    def snapshot(self):
+        with self._lock:
+            return self.faiss.serialize_index(self._index)
+
+    @staticmethod
+    def write_snapshot(snapshot, path):
+        # serialize_index produces the same bytes write_index would
+        with open(path, 'wb') as f:
+            f.write(snapshot.tobytes())
+
+    def restore(self, path, vectors, labels, stored_labels):
+        index = self.faiss.read_index(str(path))
+        if index.d != self.dim:
+            raise ValueError("stored faiss index has another dimension")
+        self._set_nprobe(index)
+        with self._lock:
+            self._index = index
+        _reconcile(self, vectors, labels, stored_labels)
+
+class HnswIndex:
+    """
+    hnswlib HNSW graph on inner product. `ef` (search) trades latency for
+    recall, `m` / `ef_construction` set graph quality at build time.
+    Removed vectors are tombstoned and their slots reused by later adds.
+    """
+    kind = 'hnsw'
+    persistent = True
+
+    def __init__(self, dim, m=32, ef=64, ef_construction=200):
+        import hnswlib
+        self.hnswlib = hnswlib
+        self.dim = dim
+        self.m = m
+        self.ef = ef
+        self.ef_construction = ef_construction
+        self._lock = threading.Lock()
+        self._count = 0
+        self._index = self._new(1024)
+
+    def __len__(self):
+        return self._count
+
+    def _new(self, capacity):
+        index = self.hnswlib.Index(space='ip', dim=self.dim)
+        index.init_index(max_elements=capacity, ef_construction=self.ef_construction,
+                         M=self.m, allow_replace_deleted=True)
+        index.set_ef(self.ef)
+        return index
+
+    def build(self, vectors, labels):
+        index = self._new(max(1024, int(len(vectors) * 1.25)))
+        if len(vectors):
+            index.add_items(np.asarray(vectors, dtype=np.float32), np.asarray(labels, dtype=np.int64))
+        with self._lock:
+            self._index, self._count = index, len(vectors)
+
+    def add(self, vectors, labels):
+        with self._lock:
+            needed = self._index.get_current_count() + len(labels)
+            if needed > self._index.get_max_elements():
+                self._index.resize_index(max(needed, 2 * self._index.get_max_elements()))
+            vectors = np.asarray(vectors, dtype=np.float32)
+            labels = np.asarray(labels, dtype=np.int64)
+            try:
+                self._index.add_items(vectors, labels, replace_deleted=True)
+            except RuntimeError:
+                # index restored without slot reuse enabled: append instead
+                self._index.add_items(vectors, labels)
+            self._count += len(labels)
+
+    def remove(self, labels):
+        with self._lock:
+            for label in labels:
+                try:
+                    self._index.mark_deleted(int(label))
+                    self._count -= 1
+                except RuntimeError:
+                    pass   # unknown or already deleted
+
+    def search(self, queries, k):
+        queries = np.asarray(queries, dtype=np.float32)
+        with self._lock:
+            k = min(k, self._count)
+            while k > 0:
+                try:
+                    self._index.set_ef(max(self.ef, k))
+                    labels, dist = self._index.knn_query(queries, k=k)
+                    break
+                except RuntimeError:
+                    # too few live neighbours reachable for k, ask for fewer
+                    k //= 2
+            if k <= 0:
+                return _empty_result(len(queries))
+        # hnswlib 'ip' distance is 1 - a.b
+        return labels.astype(np.int64), _distances(1.0 - dist)
+
+    def snapshot(self):
+        with self._lock:
+            return pickle.dumps(self._index, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def write_snapshot(snapshot, path):
+        with open(path, 'wb') as f:
+            f.write(snapshot)
+
+    def restore(self, path, vectors, labels, stored_labels):
+        with open(path, 'rb') as f:
+            index = pickle.load(f)
+        if index.dim != self.dim:
+            raise ValueError("stored hnsw index has another dimension")
+        needed = len(labels) + 1024
+        if index.get_max_elements() < needed:
+            index.resize_index(needed)
+        index.set_ef(self.ef)
+        with self._lock:
+            self._index, self._count = index, len(stored_labels)
+        _reconcile(self, vectors, labels, stored_labels)
+
+def make_index(kind, dim, size=0, min_size=0):
+    """
+    Index for a gallery of `size` vectors. Below `min_size` brute force is
+    both exact and fast enough; 'auto' picks faiss, then hnswlib, then the
+    numpy IVF, and a missing optional library falls back to the numpy IVF.
+    """
+    kind = (kind or 'brute').lower()
+    if kind == 'brute' or size < min_size:
+        return BruteForceIndex(dim)
+    if kind == 'auto':
+        kind = 'faiss' if has_library('faiss') else 'hnsw' if has_library('hnswlib') else 'ivf'
+    if kind == 'faiss' and has_library('faiss'):
+        return FaissIndex(dim, nlist=GALLERY_IVF_NLIST, nprobe=GALLERY_IVF_NPROBE)
+    if kind == 'hnsw' and has_library('hnswlib'):
+        return HnswIndex(dim, m=GALLERY_HNSW_M, ef=GALLERY_HNSW_EF, ef_construction=GALLERY_HNSW_EF_BUILD)
+    if kind not in ('ivf', 'faiss', 'hnsw'):
+        face_proc_logger.warning(f"Unknown GALLERY_INDEX {kind!r}, using brute force")
+        return BruteForceIndex(dim)
+    if kind != 'ivf':
+        face_proc_logger.warning(f"GALLERY_INDEX={kind} but the library is not installed, using numpy IVF")
+    return IVFIndex(dim, nlist=GALLERY_IVF_NLIST, nprobe=GALLERY_IVF_NPROBE)
+
+def recall_check(index, vectors, labels, sample=200, top_n=10, noise=0.05, seed=0):
+    """
+    Recall@top_n of `index` against exact brute force, on gallery vectors
+    perturbed by a little noise (a stand-in for another photo of the same
+    person), plus the per-query latency of both.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    labels = np.asarray(labels, dtype=np.int64)
+    if len(vectors) == 0 or sample <= 0:
+        return None
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), min(sample, len(vectors)), replace=False)
+    queries = normalize_rows(vectors[picks] + rng.normal(0, noise, (len(picks), vectors.shape[1])))
+    k = min(top_n, len(vectors))
+
+    start = time.perf_counter()
+    exact_idx, _ = top_matches(queries, vectors, top_n=k)
+    brute_s = time.perf_counter() - start
+    start = time.perf_counter()
+    found, _ = index.search(queries, k)
+    index_s = time.perf_counter() - start
+
+    exact = labels[exact_idx]
+    hits = sum(len(np.intersect1d(e, f[f >= 0])) for e, f in zip(exact, found))
+    return {
+        'index':    index.kind,
+        'queries':  len(picks),
+        'top_n':    k,
+        'recall':   round(hits / float(len(picks) * k), 4),
+        'index_ms': round(1000 * index_s / len(picks), 4),
+        'brute_ms': round(1000 * brute_s / len(picks), 4),
+    }
+
+class IndexStore:
+    """
+    Built index plus its label → embedding-id map, saved under `directory`
+    so a restart reloads it instead of retraining. The meta file names the
+    index file it belongs to and is replaced last, so an interrupted save
+    leaves the previous pair intact.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.directory, 'meta.npz')
+
+    def load_meta(self):
+        if not os.path.exists(self.meta_path):
+            return None
+        try:
+            with np.load(self.meta_path, allow_pickle=False) as z:
+                return {
+                    'kind':          str(z['kind']),
+                    'dim':           int(z['dim']),
+                    'file':          str(z['index_file']),
+                    'labels':        z['labels'].astype(np.int64),
+                    'embedding_ids': z['embedding_ids'],
+                    'next_label':    int(z['next_label']),
+                }
+        except (OSError, KeyError, ValueError) as e:
+            face_proc_logger.warning(f"Ignoring unreadable gallery index meta: {e}")
+            return None
+
+    def restore(self, index, meta, vectors, labels):
+        """Load the stored index into `index`; False if it can't be used."""
+        if meta is None or meta['kind'] != index.kind or meta['dim'] != index.dim:
+            return False
+        try:
+            index.restore(os.path.join(self.directory, meta['file']), vectors, labels, meta['labels'])
+            return True
+        except Exception as e:
+            face_proc_logger.warning(f"Rebuilding gallery index, stored one unusable: {e}")
+            return False
+
+    def save(self, index, snapshot, labels, embedding_ids, next_label):
+        """
+        Write an index snapshot (see snapshot()), the label map it was taken
+        with and the next unused label; deleted labels stay tombstoned in
+        some indexes, so they must never be handed out again.
+        """
+        if not index.persistent:
+            return
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            name = f"index.{uuid.uuid4().hex[:8]}.{index.kind}"
+            index.write_snapshot(snapshot, os.path.join(self.directory, name))
+            tmp = self.meta_path + '.tmp'
+            with open(tmp, 'wb') as f:
+                np.savez(
+                    f, kind=np.array(index.kind), dim=np.array(index.dim), index_file=np.array(name),
+                    labels=np.asarray(labels, dtype=np.int64),
+                    embedding_ids=np.array([str(e) for e in embedding_ids]),
+                    next_label=np.array(next_label, dtype=np.int64),
+                )
+            os.replace(tmp, self.meta_path)
+            for old in os.listdir(self.directory):
+                if old.startswith('index.') and old != name:
+                    os.remove(os.path.join(self.directory, old))
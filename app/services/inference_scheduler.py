@@ -0,0 +1,108 @@
+# app/services/inference_scheduler.py
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from config.logger_config import exec_time_logger
+
+class InferenceScheduler:
+    """
+    Collects frames from all cameras into short time windows and runs them
+    through the models as one batch, instead of serializing cameras one
+    frame at a time behind a global lock.
+
+    batch_fn(frames, contexts) must return one result per frame, in order;
+    contexts carries whatever per-frame options the caller submitted.
+    With workers > 1 several threads collect and run batches concurrently
+    (batch_fn must then be thread-safe, e.g. backed by a session pool).
+    """
+    def __init__(self, batch_fn, max_batch=8, max_wait_ms=15, name="inference", workers=1):
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self.workers = max(1, int(workers))
+        self._queue = queue.Queue()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'batches': 0,
+            'frames': 0,
+            'max_batch_seen': 0,
+            'last_batch_time': 0.0,
+        }
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                name = self.name if self.workers == 1 else f"{self.name}-{i}"
+                t = threading.Thread(target=self._run, name=name, daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, cam_name, frame, callback, context=None):
+        """Queue a frame; callback(cam_name, result) fires from the scheduler thread."""
+        self._ensure_started()
+        self._queue.put((cam_name, frame, context, callback))
+
+    def infer(self, cam_name, frame, context=None, timeout=None):
+        """Blocking helper for worker threads: submit and wait for this frame's result."""
+        fut = Future()
+
+        def _resolve(_cam, result):
+            if isinstance(result, BaseException):
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
+
+        self.submit(cam_name, frame, _resolve, context=context)
+        return fut.result(timeout=timeout)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _collect(self):
+        """Block for the first frame, then keep collecting until the batch is full or the window closes."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            frames = [frame for _, frame, _, _ in batch]
+            contexts = [context for _, _, context, _ in batch]
+
+            start = time.time()
+            try:
+                results = self.batch_fn(frames, contexts)
+            except Exception as e:
+                exec_time_logger.error(f"[{self.name}] batch of {len(frames)} failed: {e}")
+                results = [e] * len(frames)
+            elapsed = time.time() - start
+
+            with self._stats_lock:
+                self.stats['batches'] += 1
+                self.stats['frames'] += len(frames)
+                self.stats['max_batch_seen'] = max(self.stats['max_batch_seen'], len(frames))
+                self.stats['last_batch_time'] = elapsed
+
+            # fan results back out to each camera's callback
+            for (cam_name, _, _, callback), result in zip(batch, results):
+                try:
+                    callback(cam_name, result)
+                except Exception as e:
+                    exec_time_logger.error(f"[{self.name}] callback for {cam_name} failed: {e}")
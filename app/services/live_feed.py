@@ -0,0 +1,122 @@
+# app/services/live_feed.py
+import threading
+from collections import defaultdict
+import cv2
+
+def feed_room(cam_name):
+    """Socket.IO room that receives a camera's frames."""
+    return f"feed:{cam_name}"
+
+class FrameSlot:
+    """Latest processed frame of one camera plus its (lazily) encoded JPEG."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frame = None
+        self.generation = 0
+        self.encoded = None
+        self.encoded_generation = 0
+
+class LiveFeedHub:
+    """
+    Per-camera latest-frame slots shared by every dashboard client.
+
+    Processing callbacks only publish a reference and bump the camera's
+    generation counter. One pump task encodes each watched camera at most once
+    per generation and emits it to that camera's room, so N clients watching
+    M cameras cost M encodes per frame — and unwatched cameras cost none.
+    """
+    def __init__(self, jpeg_quality=80, max_fps=25):
+        self.jpeg_quality = jpeg_quality
+        self.interval = 1.0 / max_fps
+        self._lock = threading.Lock()
+        self._slots = defaultdict(FrameSlot)
+        self._subscribers = defaultdict(set)   # cam_name → {sid, ...}
+        self._sent = {}                        # cam_name → last emitted generation
+        self.counters = {'published': 0, 'encoded': 0, 'emitted': 0}
+
+    # ─── subscriptions ─────────────────────────────────────────────────
+    def subscribe(self, sid, cam_name):
+        with self._lock:
+            self._subscribers[cam_name].add(sid)
+
+    def unsubscribe(self, sid, cam_name=None):
+        """Drop one subscription, or all of a client's subscriptions when cam_name is None."""
+        with self._lock:
+            cams = [cam_name] if cam_name else list(self._subscribers)
+            for cam in cams:
+                self._subscribers[cam].discard(sid)
+                if not self._subscribers[cam]:
+                    self._subscribers.pop(cam, None)
+
+    def watched_cameras(self, active_feed=None):
+        with self._lock:
+            cams = set(self._subscribers)
+        if active_feed:
+            cams.add(active_feed)
+        return cams
+
+    def subscriber_count(self, cam_name):
+        with self._lock:
+            return len(self._subscribers.get(cam_name, ()))
+
+    # ─── frames ────────────────────────────────────────────────────────
+    def publish(self, cam_name, frame, watched=True):
+        """Store the newest frame for cam_name (no encoding here)."""
+        slot = self._slots[cam_name]
+        with slot.lock:
+            slot.generation += 1
+            # idle cameras keep only their counter, not the pixels
+            slot.frame = frame if watched else None
+            if not watched:
+                slot.encoded = None
+        self.counters['published'] += 1
+
+    def latest_jpeg(self, cam_name):
+        """(jpeg_bytes, generation) for the camera, encoding only if the frame changed."""
+        slot = self._slots.get(cam_name)
+        if slot is None:
+            return None, 0
+        with slot.lock:
+            if slot.frame is None:
+                return slot.encoded, slot.encoded_generation
+            if slot.encoded_generation != slot.generation:
+                success, buf = cv2.imencode('.jpg', slot.frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                if success:
+                    slot.encoded = buf.tobytes()
+                    slot.encoded_generation = slot.generation
+                    self.counters['encoded'] += 1
+            return slot.encoded, slot.encoded_generation
+
+    def forget(self, cam_name):
+        """Release a stopped camera's slot."""
+        self._slots.pop(cam_name, None)
+        self._sent.pop(cam_name, None)
+
+    def stats(self):
+        with self._lock:
+            subscribers = {cam: len(sids) for cam, sids in self._subscribers.items()}
+        return dict(self.counters, subscribers=subscribers)
+
+    # ─── pump ──────────────────────────────────────────────────────────
+    def run(self, socketio, get_active_feed):
+        """Background task: emit every watched camera's new frames."""
+        while True:
+            active_feed = get_active_feed()
+            for cam_name in self.watched_cameras(active_feed):
+                jpeg, generation = self.latest_jpeg(cam_name)
+                if jpeg is None or generation == self._sent.get(cam_name):
+                    continue
+                self._sent[cam_name] = generation
+
+                # Send a single payload dict; bytes get sent as true binary attachment.
+                payload = {'camera_name': cam_name, 'image': jpeg}
+                if cam_name == active_feed:
+                    # legacy single active feed goes to every client
+                    socketio.emit('frame-bin', payload)
+                else:
+                    socketio.emit('frame-bin', payload, to=feed_room(cam_name))
+                self.counters['emitted'] += 1
+            socketio.sleep(self.interval)
+
+# module‑level singleton
+live_feed = LiveFeedHub()
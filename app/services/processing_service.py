@@ -14,7 +14,7 @@ class ProcessingService:
         self.last_processed = {}  # Tracks last processing time per camera
         self.MIN_PROCESS_INTERVAL = 0.1  # 100ms between frames per camera
 
-    def submit(self, cam_name, frame, callback):
+    def submit(self, cam_name, frame, callback, captured_at=None, hires=None):
         now = time.monotonic()
         last_ts = self.last_processed.get(cam_name, 0)
         
@@ -23,15 +23,15 @@ class ProcessingService:
            (self.futures.get(cam_name) and not self.futures[cam_name].done()):
             return
         
-        fut = self.executor.submit(self._do_processing, cam_name, frame)
+        fut = self.executor.submit(self._do_processing, cam_name, frame, captured_at, hires)
         self.futures[cam_name] = fut
         self.last_processed[cam_name] = now
         fut.add_done_callback(partial(self._done, cam_name, callback=callback))
 
-    def _do_processing(self, cam_name, frame):
+    def _do_processing(self, cam_name, frame, captured_at=None, hires=None):
         with self.app.app_context():
             start = time.time()
-            out = self.face_processor.process_frame(frame, cam_name)
+            out = self.face_processor.process_frame(frame, cam_name, captured_at=captured_at, hires=hires)
             # exec_time_logger.debug(f"Processed {cam_name} in {time.time()-start:.3f}s")
             return out
 
@@ -8,8 +8,10 @@ from werkzeug.utils import secure_filename
 from sqlalchemy.exc import SQLAlchemyError
 
 from app.models.model import db, Subject, Img, Embedding
+from app.services.embedding_gallery import embedding_gallery
+from app.utils.embedding_codec import encode_embedding
 from insightface.app import FaceAnalysis
-from config.paths import MODEL_PACK_NAME, SUBJECT_IMG_DIR
+from config.paths import MODEL_PACK_NAME, SUBJECT_IMG_DIR, EMBEDDING_STORE_DTYPE
 from config.logger_config import sub_proc_logger
 
 # initialize the face‐analysis engine once
@@ -89,7 +91,8 @@ class SubjectService:
             raise ValueError("No face embedding found")
             
         emb = Embedding(
-            embedding=face.embedding.tolist(),
+            id=uuid.uuid4(),  # known before flush so the gallery delta can carry it
+            embedding=encode_embedding(face.embedding, EMBEDDING_STORE_DTYPE),
             calculator=model,
             subject_id=subject_id,
             img_id=img_id
@@ -140,9 +143,11 @@ class SubjectService:
             db.session.flush()
 
             # Save images + embeddings
+            gallery_entries = []
             for file_obj, disk_path, face in image_data:
                 img = self._create_image_record(disk_path, subject.id)
-                self._create_embedding_record(face, subject.id, img.id)
+                emb = self._create_embedding_record(face, subject.id, img.id)
+                gallery_entries.append((emb.id, subject.id, subject_name, face.embedding))
 
                 processed_images.append({
                     "filename": disk_path.name,
@@ -151,6 +156,7 @@ class SubjectService:
                 })
 
             db.session.commit()
+            embedding_gallery.publish_add(gallery_entries)
             sub_proc_logger.info(f"add_Subject successful for {subject_name} with {len(processed_images)} images")
 
             return {
@@ -185,9 +191,11 @@ class SubjectService:
             disk_path, face = self._process_uploaded_image(file_obj)
             img = self._create_image_record(disk_path, subject.id)
 
-            self._create_embedding_record(face, subject.id, img.id)
-            
+            emb = self._create_embedding_record(face, subject.id, img.id)
+            gallery_entry = (emb.id, subject.id, subject.subject_name, face.embedding)
+
             db.session.commit()
+            embedding_gallery.publish_add([gallery_entry])
             sub_proc_logger.info(f"add_img successful for {subject.subject_name} with img:{file_obj.filename}")
             return {"message": "Image added", "img_id": str(img.id)}, 200
             
@@ -215,8 +223,10 @@ class SubjectService:
                 except Exception:
                     pass
 
+        removed_id = sub.id
         db.session.delete(sub)
         db.session.commit()
+        embedding_gallery.publish_remove(subject_ids=[removed_id])
         sub_proc_logger.info(f"sub_id:{subject_id} removed from DB for delete_sub")
         return {"message": f"Subject {sub.subject_name} removed"}, 200
 
@@ -246,8 +256,10 @@ class SubjectService:
             except Exception:
                 pass
 
+        embedding_ids = [emb.id for emb in img.embeddings]
         db.session.delete(img)
         db.session.commit()
+        embedding_gallery.publish_remove(embedding_ids=embedding_ids)
         sub_proc_logger.info(f"img_id:{img_id} removed from DB for delete_img")
         return {"message": "Image removed"}, 200
 
@@ -266,8 +278,10 @@ class SubjectService:
                 setattr(sub, key, value)
             else:
                 sub_proc_logger.warning(f"Invalid field {key} for subject edit")
+        subject_id, subject_name = sub.id, sub.subject_name
         try:
             db.session.commit()
+            embedding_gallery.publish_rename(subject_id, subject_name)
             sub_proc_logger.info(f"Subject {sub.subject_name} updated successfully")
             return {"message": "Subject updated"}, 200
         except SQLAlchemyError as e:
@@ -289,6 +303,7 @@ class SubjectService:
         engine = FaceAnalysis(name=name, allowed_modules=['detection','recognition'])
         engine.prepare(ctx_id=0, det_size=(640,640))
 
+        gallery_entries = []
         for img in sub.images:
             path = SUBJECT_IMG_DIR / os.path.basename(img.image_url)
             frame = cv2.imread(str(path))
@@ -300,13 +315,16 @@ class SubjectService:
                 if emb is None: 
                     continue
                 e = Embedding(
-                    embedding=emb.tolist(),
+                    id=uuid.uuid4(),
+                    embedding=encode_embedding(emb, EMBEDDING_STORE_DTYPE),
                     calculator=name,
                     subject_id=sub.id,
                     img_id=img.id
                 )
                 db.session.add(e)
+                gallery_entries.append((e.id, sub.id, sub.subject_name, emb))
         db.session.commit()
+        embedding_gallery.publish_add(gallery_entries)
         return {"message": f"Regenerated embeddings under model {name}"}, 200
 
 # module‑level singleton used by your routes:
@@ -11,6 +11,10 @@ from datetime import datetime, timedelta
 from collections import defaultdict
 from app.utils.time_utils import now_local, to_utc, parse_iso
 from app.services.camera_manager import camera_service
+from app.services.detection_writer import detection_writer
+from app.processors.save_face import crop_writer
+from app.services.frame_pump import frame_pump
+from app.services.embedding_gallery import embedding_gallery
 from app.services.reco_table_helper import *
 import traceback
 
@@ -49,6 +53,10 @@ def giving_system_stats():
             "total_detections": total_detections,
             "active_cameras":   total_active_cameras,
             "total_cameras": total_cameras,
+            "detection_writer": detection_writer.stats(),
+            "crop_writer":      crop_writer.stats(),
+            "frame_pump":       frame_pump.stats(),
+            "gallery":          embedding_gallery.stats(),
             "subjects":         subjects
         }), 200
 
@@ -1,31 +1,135 @@
 # app/services/videocapture.py
+import os
 import subprocess
+import sys
+import time
 import cv2
 import numpy as np
-from threading import Thread, Lock
-from config.paths import USE_CUDA
+from threading import Thread, Lock, Condition, current_thread
+from config.paths import USE_CUDA, FRAME_RING_SIZE, DECODE_MODE, DECODE_FPS, DECODE_PREVIEW_FPS
+from config.paths import DET_FRAME_SIZE, HIRES_FRAME_SIZE
+
+class FrameRing(object):
+    """
+    Preallocated frame buffers that are filled in place and handed out as
+    read-only views. A buffer is only reused once no consumer holds a view of
+    it; if every buffer is still leased a fresh one replaces the oldest slot.
+    """
+    def __init__(self, width, height, size):
+        self.shape = (height, width, 3)
+        self.nbytes = width * height * 3
+        self.buffers = [self._new_buffer() for _ in range(max(2, size))]
+        self.seqs = [0] * len(self.buffers)   # frame number stored in each slot
+        self.latest = None
+        self.grown = 0      # buffers replaced because all were still leased
+
+    def _new_buffer(self):
+        return np.empty(self.shape, dtype=np.uint8)
+
+    def acquire(self):
+        """
+        Pick the next slot that is safe to overwrite: not the latest frame and
+        not referenced by any consumer view (a view keeps a reference to its
+        base buffer, so the refcount tells us).
+        """
+        n = len(self.buffers)
+        start = 0 if self.latest is None else self.latest + 1
+        for k in range(n):
+            i = (start + k) % n
+            # references: the ring list + getrefcount's own argument
+            if i != self.latest and sys.getrefcount(self.buffers[i]) <= 2:
+                return i
+        # every buffer is leased: give the oldest slot a fresh buffer,
+        # the old one lives on until its consumers drop it
+        i = start % n
+        if i == self.latest:
+            i = (i + 1) % n
+        self.buffers[i] = self._new_buffer()
+        self.grown += 1
+        return i
+
+    def acquire_for_write(self):
+        """acquire() and forget the slot's old frame number, so find() can't hand it out mid-write."""
+        slot = self.acquire()
+        self.seqs[slot] = 0
+        return slot
+
+    def publish(self, slot, seq):
+        """Mark slot as the newest frame (call under the owner's lock)."""
+        self.seqs[slot] = seq
+        self.latest = slot
+
+    def view(self, slot):
+        frame = self.buffers[slot].view()
+        frame.flags.writeable = False
+        return frame
+
+    def find(self, seq):
+        """Slot still holding frame number seq, or None if it was overwritten."""
+        for i, s in enumerate(self.seqs):
+            if s == seq:
+                return i
+        return None
 
 class VideoStream(object):
-    def __init__(self, src=0, width=960, height=540):
+    def __init__(self, src=0, width=DET_FRAME_SIZE[0], height=DET_FRAME_SIZE[1], ring_size=FRAME_RING_SIZE,
+                 decode_mode=DECODE_MODE, output_fps=None, hires_size=HIRES_FRAME_SIZE):
         """
         Initializes the VideoStream instance with FFmpeg or OpenCV as the backend.
 
+        Frames are decoded straight into a preallocated FrameRing and handed
+        out as read-only views (no per-frame allocation or copy).
+
+        With the ffmpeg backend, decode_mode can cut the work before frames
+        reach Python: "decimate" drops frames with the fps filter ahead of
+        scaling / pixel conversion, "keyframe" skips decoding everything but
+        I-frames. "full" outputs every frame.
+
+        hires_size adds a second ffmpeg output of the same frames at a higher
+        resolution (read with read_hires); the regular output stays small for
+        detection and preview.
+
         Args:
             src (str or int): Video source (e.g., RTSP link or webcam index).
             width (int): Width of the output frames.
             height (int): Height of the output frames.
-            backend (str): Backend for video capture ("ffmpeg" or "opencv").
+            ring_size (int): Number of preallocated frame buffers.
+            decode_mode (str): "full", "decimate" or "keyframe".
+            output_fps (float): Output rate for "decimate"; defaults to the
+                AI rate, or the preview rate if that is higher.
+            hires_size (tuple): (width, height) of the high-resolution output,
+                None to disable (ffmpeg backend only).
         """
         self.src = src
         self.width = width
         self.height = height
         self.frame_size = width * height * 3
+        self.decode_mode = decode_mode
+        if decode_mode == "decimate" and not output_fps:
+            output_fps = max(DECODE_FPS, DECODE_PREVIEW_FPS)
+        self.output_fps = output_fps if decode_mode == "decimate" else None
+        self.hires_size = tuple(hires_size) if hires_size else None
         self.started = False
+        self.stopped = False    # stop() already ran; later calls are no-ops
         self.read_lock = Lock()
-        self.frame = None
+        self.new_frame = Condition(self.read_lock)  # notified on every decoded frame
         self.pipe = None
         self.cap = None
 
+        self._ring = FrameRing(width, height, ring_size)
+        self.seq = 0            # increments once per decoded frame
+        self.timestamp = None   # wall-clock capture time of the latest frame
+
+        # second output: same frames, larger size, paired by frame number
+        self._hires_ring = FrameRing(*self.hires_size, ring_size) if self.hires_size else None
+        self._hires_pipe = None
+        self.hires_seq = 0
+        self.new_hires = Condition(Lock())
+
+    @property
+    def ring_grown(self):
+        return self._ring.grown + (self._hires_ring.grown if self._hires_ring else 0)
+
     def start(self):
         """
         Starts the video capture based on the selected backend.
@@ -34,20 +138,27 @@ class VideoStream(object):
             print("Stream already started!")
             return None
         self.started = True
+        self.stopped = False
         if self.src == "0":
             self.backend = "opencv"
             print("opening opencv")
+            # a webcam has a single capture size, no second output
+            self.hires_size = None
+            self._hires_ring = None
             self._start_opencv()
         else:
             self.backend = "ffmpeg"
             self._start_ffmpeg()
-        
+
         # else:
             # raise ValueError("Invalid backend. Choose 'ffmpeg' or 'opencv'.")
 
         self.thread = Thread(target=self._update, args=())
         self.thread.daemon = True
         self.thread.start()
+        if self._hires_pipe is not None:
+            self.hires_thread = Thread(target=self._update_hires, args=(), daemon=True)
+            self.hires_thread.start()
         return self
 
     def _start_ffmpeg(self):
@@ -60,9 +171,32 @@ class VideoStream(object):
         if USE_CUDA:
             command += ["-hwaccel", "cuda"]  # Enable CUDA if requested
 
+        if self.decode_mode == "keyframe":
+            command += ["-skip_frame", "nokey"]          # Decode I-frames only
+
+        video_filter = f"scale={self.width}:{self.height}"  # Resize video
+        rate_filter = f"fps={self.output_fps:g}," if self.output_fps else ""  # drop frames before scaling
+
+        command += ["-i", self.src]                      # Input video source
+        if self.decode_mode == "keyframe":
+            command += ["-vsync", "0"]                   # Pass keyframes through, no duplicates
+
+        pass_fds = ()
+        if self.hires_size:
+            # one decode, split into a detection-size and a high-res output;
+            # the high-res frames go to an extra pipe
+            read_fd, write_fd = os.pipe()
+            hw, hh = self.hires_size
+            command += [
+                "-filter_complex",
+                f"[0:v]{rate_filter}split=2[det_in][hi_in];"
+                f"[det_in]{video_filter}[det];[hi_in]scale={hw}:{hh}[hi]",
+                "-map", "[det]",
+            ]
+            pass_fds = (write_fd,)
+        else:
+            command += ["-vf", rate_filter + video_filter]
         command += [
-            "-i", self.src,                              # Input video source
-            "-vf", f"scale={self.width}:{self.height}",  # Resize video
             "-f", "rawvideo",                            # Output raw video format
             "-pix_fmt", "bgr24",                         # OpenCV-compatible pixel format
             "-an",                                       # Disable audio
@@ -70,11 +204,21 @@ class VideoStream(object):
             "-tune", "zerolatency",                      # Optimize for low latency
             "-"                                          # Output to stdout
         ]
+        if self.hires_size:
+            command += [
+                "-map", "[hi]",
+                "-f", "rawvideo", "-pix_fmt", "bgr24", "-an", "-sn",
+                f"pipe:{write_fd}"
+            ]
 
-        print(f"FFmpeg started for {self.src}")
+        print(f"FFmpeg started for {self.src} ({self.decode_mode} decode)")
         self.pipe = subprocess.Popen(
-            command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=10**8
+            command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=10**8,
+            pass_fds=pass_fds
         )
+        if self.hires_size:
+            os.close(write_fd)   # ffmpeg holds the write end now
+            self._hires_pipe = os.fdopen(read_fd, "rb", buffering=10**8)
 
     def _start_opencv(self):
         """
@@ -88,54 +232,152 @@ class VideoStream(object):
         self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
         self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
 
+    @staticmethod
+    def _read_exact(stream, buf, size):
+        """Fill buf from a pipe; False on short read / end of stream."""
+        view = memoryview(buf).cast('B')
+        got = 0
+        while got < size:
+            n = stream.readinto(view[got:])
+            if not n:
+                return False
+            got += n
+        return True
+
     def _update(self):
         """
         Continuously reads frames from the selected backend.
         """
+        ring = self._ring
         while self.started:
+            slot = ring.acquire()
             if self.backend == "ffmpeg":
-                raw_frame = self.pipe.stdout.read(self.frame_size)
-                if len(raw_frame) != self.frame_size:
+                if not self._read_exact(self.pipe.stdout, ring.buffers[slot], ring.nbytes):
                     print("Failed to grab frame or end of stream")
                     self.started = False
                     break
-                frame = np.frombuffer(raw_frame, np.uint8).reshape((self.height, self.width, 3))
             elif self.backend == "opencv":
-                ret, frame = self.cap.read()
+                buf = ring.buffers[slot]
+                ret, frame = self.cap.read(buf)
                 if not ret:
                     print("Failed to grab frame from OpenCV.")
                     self.started = False
                     break
+                if frame is not buf:
+                    # device ignored the requested size; adopt its buffer
+                    ring.buffers[slot] = np.ascontiguousarray(frame)
+                del buf, frame
             else:
-                frame = None
-            
-            with self.read_lock:
-                self.frame = frame
+                break
+
+            with self.new_frame:
+                self.seq += 1
+                ring.publish(slot, self.seq)
+                self.timestamp = time.time()
+                self.new_frame.notify_all()
+
+        # wake anyone blocked in read_next so they notice the stream ended
+        with self.new_frame:
+            self.new_frame.notify_all()
+
+    def _update_hires(self):
+        """Reads the high-res output; its frame numbers line up with the detection output."""
+        ring = self._hires_ring
+        while self.started:
+            with self.new_hires:
+                # under the lock: read_hires looks slots up by frame number
+                slot = ring.acquire_for_write()
+            if not self._read_exact(self._hires_pipe, ring.buffers[slot], ring.nbytes):
+                break
+            with self.new_hires:
+                self.hires_seq += 1
+                ring.publish(slot, self.hires_seq)
+                self.new_hires.notify_all()
+        with self.new_hires:
+            self.new_hires.notify_all()
 
     def read(self):
         """
         Returns the latest frame from the buffer.
 
+        The frame is a read-only view into the ring; copy it before drawing.
+
         Returns:
             np.ndarray or None: The latest frame, or None if no frame is available.
         """
+        return self.read_with_seq()[1]
+
+    def read_with_seq(self):
+        """
+        Returns (seq, frame) for the latest frame, or (seq, None) if none yet.
+        seq only changes when a new frame was decoded.
+        """
+        seq, _, frame = self.read_latest()
+        return seq, frame
+
+    def read_latest(self):
+        """Returns (seq, capture_timestamp, frame) for the latest frame; frame is None if none yet."""
         with self.read_lock:
-            if self.frame is not None:
-                return self.frame.copy()
-            else:
-                return None
+            return self._snapshot()
+
+    def read_next(self, after_seq=0, timeout=None):
+        """
+        Block until a frame newer than after_seq is available (or timeout).
+
+        Returns (seq, capture_timestamp, frame); frame is None on timeout or
+        when the stream stopped, so callers only ever work on fresh frames.
+        """
+        with self.new_frame:
+            fresh = self.new_frame.wait_for(
+                lambda: self.seq > after_seq or not self.started, timeout=timeout
+            )
+            if not fresh or self.seq <= after_seq:
+                return self.seq, self.timestamp, None
+            return self._snapshot()
+
+    def read_hires(self, seq, timeout=0.05):
+        """
+        High-res view of frame number seq (as returned by read_next), waiting
+        up to timeout for it to arrive. None if there is no high-res output or
+        that frame is already gone — never a different frame.
+        """
+        if self._hires_ring is None:
+            return None
+        with self.new_hires:
+            self.new_hires.wait_for(
+                lambda: self.hires_seq >= seq or not self.started, timeout=timeout
+            )
+            slot = self._hires_ring.find(seq)
+            return None if slot is None else self._hires_ring.view(slot)
+
+    def _snapshot(self):
+        """(seq, timestamp, read-only view of the latest frame); call with read_lock held."""
+        if self._ring.latest is None:
+            return self.seq, self.timestamp, None
+        return self.seq, self.timestamp, self._ring.view(self._ring.latest)
+
+    def frame_age(self):
+        """Seconds since the last decoded frame (None before the first one)."""
+        ts = self.timestamp
+        return None if ts is None else time.time() - ts
 
     def stop(self):
         """
         Stops the frame-reading thread and cleans up resources.
+
+        Also cleans up after a stream that already ended on its own (short
+        read), whose decoder process would otherwise be left behind.
+        Calling it again is a no-op.
         """
-        if not self.started:
+        if self.stopped:
             return
+        self.stopped = True
         self.started = False
-        if self.thread.is_alive():
-            self.thread.join()
-        
-        if self.backend == "ffmpeg" and self.pipe:
+        with self.new_frame:
+            self.new_frame.notify_all()
+
+        if getattr(self, "backend", None) == "ffmpeg" and self.pipe:
+            # terminate first: a reader blocked on a stalled pipe gets EOF
             try:
                 self.pipe.terminate()
                 self.pipe.wait(timeout=0.1)
@@ -145,12 +387,27 @@ class VideoStream(object):
             finally:
                 self.pipe = None
                 print("FFmpeg process closed.")
-        elif self.backend == "opencv" and self.cap:
+
+        thread = getattr(self, "thread", None)
+        if thread is not None and thread.is_alive() and thread is not current_thread():
+            thread.join(timeout=2.0)
+
+        if getattr(self, "_hires_pipe", None) is not None:
+            hires_thread = getattr(self, "hires_thread", None)
+            if hires_thread is not None and hires_thread.is_alive():
+                hires_thread.join(timeout=1.0)
+            self._hires_pipe.close()
+            self._hires_pipe = None
+        if getattr(self, "backend", None) == "opencv" and self.cap:
             self.cap.release()
+            self.cap = None
             print("OpenCV capture closed.")
 
     def __del__(self):
         """
-        Ensures resources are cleaned up when the instance is deleted.
+        Ensures resources are cleaned up when the instance is deleted
+        (also when __init__ failed before every attribute was set).
         """
-        self.stop()
\ No newline at end of file
+        if getattr(self, "stopped", True) or getattr(self, "new_frame", None) is None:
+            return
+        self.stop()
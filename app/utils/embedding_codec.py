@@ -0,0 +1,35 @@
+# app/utils/embedding_codec.py
+import numpy as np
+
+# Embeddings are stored as raw big-endian float blobs (bytea). Big-endian
+# float32 is exactly what Postgres' float4send() emits, so old ARRAY rows
+# convert in SQL (see scripts/manage_db.py); float16 halves the size again.
+STORE_DTYPES = {'float32': np.dtype('>f4'), 'float16': np.dtype('>f2')}
+
+def encode_embedding(vector, dtype='float32'):
+    """Vector → bytea blob in the configured storage precision."""
+    return np.asarray(vector, dtype=STORE_DTYPES[dtype]).tobytes()
+
+def _blob_dtype(size, dim):
+    for dtype in STORE_DTYPES.values():
+        if size == dim * dtype.itemsize:
+            return dtype
+    raise ValueError(f"embedding blob of {size} bytes is not a {dim}-d float32/float16 vector")
+
+def decode_embedding(blob, dim):
+    return np.frombuffer(blob, dtype=_blob_dtype(len(blob), dim)).astype(np.float32)
+
+def decode_embeddings(blobs, dim):
+    """
+    Blobs → (N, dim) float32 matrix. When every row has the same precision
+    (the normal case) this is a single join + frombuffer, no per-row work.
+    """
+    blobs = list(blobs)
+    if not blobs:
+        return np.empty((0, dim), dtype=np.float32)
+    sizes = {len(b) for b in blobs}
+    if len(sizes) == 1:
+        dtype = _blob_dtype(sizes.pop(), dim)
+        return np.frombuffer(b''.join(blobs), dtype=dtype).astype(np.float32).reshape(-1, dim)
+    # mixed precision (EMBEDDING_STORE_DTYPE changed after enrollment)
+    return np.stack([decode_embedding(b, dim) for b in blobs])
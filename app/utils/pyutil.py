@@ -5,4 +5,12 @@ def get_env_bool(key: str, default: str = "true") -> bool:
     # if somebody ever passes a real bool into os.environ (unusual!), honor it
     if isinstance(val, bool):
         return val
-    return str(val).strip().lower() in ("true", "1", "yes", "y")
\ No newline at end of file
+    return str(val).strip().lower() in ("true", "1", "yes", "y")
+
+def get_env_size(key: str, default: str = ""):
+    """Parse a "WIDTHxHEIGHT" env var into (width, height); None when empty."""
+    val = str(os.getenv(key, default)).strip().lower()
+    if not val or val in ("0", "none", "off", "false"):
+        return None
+    width, height = val.split("x")
+    return int(width), int(height)
\ No newline at end of file
@@ -0,0 +1,52 @@
+# app/utils/roi.py
+import numpy as np
+
+def roi_polygon(roi):
+    """
+    Normalise an ROI to a polygon of (x, y) points in 0..1 frame coordinates.
+    Accepts a rect [x1, y1, x2, y2] or a polygon [[x, y], ...]; None → whole frame.
+    """
+    if not roi:
+        return None
+    if len(roi) == 4 and all(isinstance(v, (int, float)) for v in roi):
+        x1, y1, x2, y2 = roi
+        return [(x1, y1), (x2, y1), (x2, y2), (x1, y2)]
+    return [(float(x), float(y)) for x, y in roi]
+
+def is_rect(polygon):
+    """True if the polygon is an axis-aligned rectangle (no masking needed)."""
+    if polygon is None or len(polygon) != 4:
+        return False
+    xs = sorted({x for x, _ in polygon})
+    ys = sorted({y for _, y in polygon})
+    return len(xs) == 2 and len(ys) == 2
+
+def validate_roi(roi):
+    """Return the ROI as stored on the Camera row, or raise ValueError."""
+    if roi in (None, [], {}):
+        return None
+    if not isinstance(roi, (list, tuple)):
+        raise ValueError("roi must be [x1, y1, x2, y2] or [[x, y], ...]")
+    try:
+        polygon = roi_polygon(roi)
+    except (TypeError, ValueError):
+        raise ValueError("roi must be [x1, y1, x2, y2] or [[x, y], ...]")
+    if len(polygon) < 3:
+        raise ValueError("roi polygon needs at least 3 points")
+    if any(not (0.0 <= v <= 1.0) for point in polygon for v in point):
+        raise ValueError("roi coordinates are fractions of the frame (0..1)")
+    x1, y1, x2, y2 = polygon_bounds(polygon, 1.0, 1.0)
+    if x2 <= x1 or y2 <= y1:
+        raise ValueError("roi has no area")
+    if len(roi) == 4 and all(isinstance(v, (int, float)) for v in roi):
+        return [float(v) for v in roi]
+    return [[float(x), float(y)] for x, y in polygon]
+
+def polygon_bounds(polygon, width, height):
+    """Bounding rect (x1, y1, x2, y2) of a normalised polygon, in pixels of a width x height frame."""
+    pts = np.asarray(polygon, dtype=np.float32)
+    x1 = int(np.floor(pts[:, 0].min() * width))
+    y1 = int(np.floor(pts[:, 1].min() * height))
+    x2 = int(np.ceil(pts[:, 0].max() * width))
+    y2 = int(np.ceil(pts[:, 1].max() * height))
+    return max(0, x1), max(0, y1), min(int(width), x2), min(int(height), y2)
@@ -1,15 +1,31 @@
 import os
 import json
+import logging
 from pathlib import Path
 from dotenv import load_dotenv
-from app.utils.pyutil import get_env_bool
+from app.utils.pyutil import get_env_bool, get_env_size
+from app.utils.embedding_codec import STORE_DTYPES
 # Load environment variables
 CLEAN_VARS = [
     'IS_RECOGNIZE','IS_RM_REPORT','IS_GEN_REPORT',
     'model_pack_name','CAMERA_SOURCES','HOST','PORT',
     'FACE_DET_LM','FACE_DET_TH','FACE_REC_TH','SECRET_KEY','USE_CUDA',
     'SKIP_FRAME_CYCLE','AI_PROCESS_FRAMES','DETECTION_OVERLAY_OPTION', 'MAX_CAM_WORKERS',
-    'DRAW_FONT_SIZE'
+    'DRAW_FONT_SIZE', 'INFER_BATCHING', 'INFER_MAX_BATCH', 'INFER_MAX_WAIT_MS',
+    'FACE_TRACKING', 'TRACK_IOU_TH', 'TRACK_MAX_MISSED', 'TRACK_RECHECK_S', 'TRACK_UNSURE_RECHECK_S',
+    'DET_COALESCE', 'DET_COOLDOWN_S', 'DET_PERIODIC_S', 'DET_BEST_QUALITY',
+    'DET_WRITER_QUEUE', 'DET_WRITER_BATCH', 'DET_WRITER_FLUSH_MS',
+    'FACE_CROP_FORMAT', 'FACE_CROP_QUALITY', 'FACE_CROP_WORKERS', 'FACE_CROP_QUEUE', 'FACE_CROP_POLICY',
+    'FRAME_RING_SIZE', 'STREAM_STALE_S', 'PUMP_MAX_FPS',
+    'DECODE_MODE', 'DECODE_FPS', 'DECODE_PREVIEW_FPS', 'DET_FRAME_SIZE', 'HIRES_FRAME_SIZE',
+    'RECONNECT_ENABLE', 'RECONNECT_BASE_S', 'RECONNECT_MAX_S', 'STARTUP_WORKERS', 'STARTUP_DEADLINE_S',
+    'ADAPTIVE_RATE', 'AI_RATE_MIN', 'AI_RATE_MAX', 'AI_RATE_HOLD_S', 'AI_RATE_HALF_LIFE_S', 'AI_RATE_BUDGET',
+    'MOTION_GATE', 'MOTION_WIDTH', 'MOTION_PIXEL_TH', 'MOTION_SENSITIVITY', 'MOTION_MAX_IDLE_S', 'MOTION_CAMERAS',
+    'INFER_SESSIONS', 'INFER_INTRA_THREADS', 'INFER_WORKERS',
+    'ANTI_SPOOF', 'ANTI_SPOOF_RECHECK_S',
+    'GALLERY_INDEX', 'GALLERY_INDEX_MIN', 'GALLERY_IVF_NLIST', 'GALLERY_IVF_NPROBE',
+    'GALLERY_HNSW_M', 'GALLERY_HNSW_EF', 'GALLERY_HNSW_EF_BUILD', 'GALLERY_RECALL_SAMPLE',
+    'GALLERY_MATCH_MODE', 'GALLERY_CENTROID_CANDIDATES', 'EMBEDDING_STORE_DTYPE'
 ]
 for v in CLEAN_VARS:
     os.environ.pop(v, None)
@@ -31,6 +47,7 @@ MODELS_DIR      = BASE_DIR / ".models"
 SUBJECT_IMG_DIR = DATABASE_DIR / "subjects_imgs"
 REPORTS_DIR     = DATABASE_DIR / "Reports"
 FACE_DIR        = REPORTS_DIR / "saved_face"
+GALLERY_INDEX_DIR = DATABASE_DIR / "gallery_index"
 
 # Ensure directories exist
 for d in (DATABASE_DIR, SUBJECT_IMG_DIR, REPORTS_DIR, FACE_DIR):
@@ -72,8 +89,114 @@ FACE_DET_LM = int(os.getenv("FACE_DET_LM", 0))
 SKIP_FRAME_CYCLE = int(os.getenv("SKIP_FRAME_CYCLE", 10))
 AI_PROCESS_FRAMES = int(os.getenv("AI_PROCESS_FRAMES", 2))
 DETECTION_OVERLAY_OPTION = int(os.getenv("DETECTION_OVERLAY_OPTION", 2)) # 1 = show last drawings, 2 = clean frames
-MAX_CAM_WORKERS = int(os.getenv("AI_PROCESS_FRAMES", 4))
+MAX_CAM_WORKERS = int(os.getenv("MAX_CAM_WORKERS", 4))
 DRAW_FONT_SIZE = float(os.getenv("DRAW_FONT_SIZE", 0.5))
 
+# Adaptive per-camera AI rate (replaces the fixed skip cycle when enabled)
+ADAPTIVE_RATE       = get_env_bool("ADAPTIVE_RATE", "false")
+AI_RATE_MIN         = float(os.getenv("AI_RATE_MIN", 1.0))          # AI fps of an idle camera
+AI_RATE_MAX         = float(os.getenv("AI_RATE_MAX", 8.0))          # AI fps while faces/motion are seen
+AI_RATE_HOLD_S      = float(os.getenv("AI_RATE_HOLD_S", 5.0))       # stay at max this long after activity
+AI_RATE_HALF_LIFE_S = float(os.getenv("AI_RATE_HALF_LIFE_S", 5.0))  # then halve the rate this often
+AI_RATE_BUDGET      = float(os.getenv("AI_RATE_BUDGET", 30.0))      # AI fps shared by all cameras
+
+# Motion gate before face detection (skip SCRFD on unchanged frames)
+MOTION_GATE        = get_env_bool("MOTION_GATE", "false")
+MOTION_WIDTH       = int(os.getenv("MOTION_WIDTH", 160))             # thumbnail width for differencing
+MOTION_PIXEL_TH    = int(os.getenv("MOTION_PIXEL_TH", 25))           # gray-level change that counts as motion
+MOTION_SENSITIVITY = float(os.getenv("MOTION_SENSITIVITY", 0.002))   # changed fraction of the ROI to pass
+MOTION_MAX_IDLE_S  = float(os.getenv("MOTION_MAX_IDLE_S", 5.0))      # let one frame through at least this often
+# per-camera overrides: {"cam": {"sensitivity": 0.01, "roi": [x1, y1, x2, y2] or [[x, y], ...]}}
+MOTION_CAMERAS     = json.loads(os.getenv("MOTION_CAMERAS", "{}"))
+
+# Cross-camera micro-batching of inference
+INFER_BATCHING    = get_env_bool("INFER_BATCHING", "false")
+INFER_MAX_BATCH   = int(os.getenv("INFER_MAX_BATCH", 8))       # frames per batch
+INFER_MAX_WAIT_MS = float(os.getenv("INFER_MAX_WAIT_MS", 15))  # how long to wait for more frames
+
+# Independent ONNX Runtime sessions (each used by one worker at a time)
+INFER_SESSIONS      = int(os.getenv("INFER_SESSIONS", 1))
+INFER_INTRA_THREADS = int(os.getenv("INFER_INTRA_THREADS", 0))  # per session, 0 = cores / INFER_SESSIONS
+INFER_WORKERS       = int(os.getenv("INFER_WORKERS", INFER_SESSIONS))  # batch scheduler threads
+
+# Face tracking (skip re-recognition of already identified faces)
+FACE_TRACKING          = get_env_bool("FACE_TRACKING", "false")
+TRACK_IOU_TH           = float(os.getenv("TRACK_IOU_TH", 0.3))
+TRACK_MAX_MISSED       = int(os.getenv("TRACK_MAX_MISSED", 5))          # AI frames before a track dies
+TRACK_RECHECK_S        = float(os.getenv("TRACK_RECHECK_S", 3.0))       # re-recognize known faces
+TRACK_UNSURE_RECHECK_S = float(os.getenv("TRACK_UNSURE_RECHECK_S", 0.5)) # re-recognize unknown/weak faces
+
+# Silent anti-spoofing (MiniFASNet ensemble, batched per frame, cached per track)
+ANTI_SPOOF           = get_env_bool("ANTI_SPOOF", "false")
+ANTI_SPOOF_RECHECK_S = float(os.getenv("ANTI_SPOOF_RECHECK_S", 2.0))  # re-check a tracked face this often
+
+# Precision of new Embedding rows (bytea blob): float32 | float16
+EMBEDDING_STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "float32").lower()
+if EMBEDDING_STORE_DTYPE not in STORE_DTYPES:
+    # config loads before the app loggers exist (they import this module)
+    logging.getLogger(__name__).warning(
+        f"Unknown EMBEDDING_STORE_DTYPE {EMBEDDING_STORE_DTYPE!r}, using 'float32'"
+    )
+    EMBEDDING_STORE_DTYPE = "float32"
+
+# Embedding gallery search index: brute | ivf (numpy) | faiss | hnsw | auto
+GALLERY_INDEX         = os.getenv("GALLERY_INDEX", "brute").lower()
+GALLERY_INDEX_MIN     = int(os.getenv("GALLERY_INDEX_MIN", 20000))    # smaller galleries stay brute force
+GALLERY_IVF_NLIST     = int(os.getenv("GALLERY_IVF_NLIST", 0))        # IVF lists, 0 = sqrt(N)
+GALLERY_IVF_NPROBE    = int(os.getenv("GALLERY_IVF_NPROBE", 16))      # lists scanned per query (recall ↑, speed ↓)
+GALLERY_HNSW_M        = int(os.getenv("GALLERY_HNSW_M", 32))
+GALLERY_HNSW_EF       = int(os.getenv("GALLERY_HNSW_EF", 64))         # search beam (recall ↑, speed ↓)
+GALLERY_HNSW_EF_BUILD = int(os.getenv("GALLERY_HNSW_EF_BUILD", 200))
+GALLERY_RECALL_SAMPLE = int(os.getenv("GALLERY_RECALL_SAMPLE", 200))  # queries for the recall check, 0 = off
+# embedding = every enrolled image | centroid = per-subject mean embedding
+# (distances run lower than per-image ones, re-tune FACE_REC_TH) |
+# centroid_max = shortlist by centroid, score by each subject's closest image
+GALLERY_MATCH_MODE          = os.getenv("GALLERY_MATCH_MODE", "embedding").lower()
+GALLERY_CENTROID_CANDIDATES = int(os.getenv("GALLERY_CENTROID_CANDIDATES", 5))  # subjects rescored in centroid_max
+
+# Detection event coalescing (one report row per visit instead of per frame)
+DET_COALESCE     = get_env_bool("DET_COALESCE", "false")
+DET_COOLDOWN_S   = float(os.getenv("DET_COOLDOWN_S", 30))   # unseen this long → next sighting is a new entry
+DET_PERIODIC_S   = float(os.getenv("DET_PERIODIC_S", 0))    # extra row every N s while present, 0 = off
+DET_BEST_QUALITY = get_env_bool("DET_BEST_QUALITY", "false") # extra row when a clearly better shot shows up
+
+# Background Detection writer
+DET_WRITER_QUEUE    = int(os.getenv("DET_WRITER_QUEUE", 5000))   # rows buffered before dropping
+DET_WRITER_BATCH    = int(os.getenv("DET_WRITER_BATCH", 200))    # rows per bulk insert
+DET_WRITER_FLUSH_MS = int(os.getenv("DET_WRITER_FLUSH_MS", 500)) # max time a row waits in the queue
+
+# Face crop persistence (report images)
+FACE_CROP_FORMAT  = os.getenv("FACE_CROP_FORMAT", "jpg")      # "jpg" or "webp"
+FACE_CROP_QUALITY = int(os.getenv("FACE_CROP_QUALITY", 90))
+FACE_CROP_WORKERS = int(os.getenv("FACE_CROP_WORKERS", 2))
+FACE_CROP_QUEUE   = int(os.getenv("FACE_CROP_QUEUE", 500))
+FACE_CROP_POLICY  = os.getenv("FACE_CROP_POLICY", "drop")     # "drop" or "block" when the disk is slow
+
+# Decoder output rate: "full" = every frame, "decimate" = ffmpeg fps filter,
+# "keyframe" = decode I-frames only (-skip_frame nokey)
+DECODE_MODE        = os.getenv("DECODE_MODE", "full").lower()
+DECODE_FPS         = float(os.getenv("DECODE_FPS", 25 * AI_PROCESS_FRAMES / SKIP_FRAME_CYCLE))  # AI rate when decimating
+DECODE_PREVIEW_FPS = float(os.getenv("DECODE_PREVIEW_FPS", 0))  # >DECODE_FPS keeps a low-rate preview, 0 = off
+
+# Stream output sizes: detection/preview frame, plus an optional high-res
+# frame (e.g. "1920x1080") used for recognition crops and report images
+DET_FRAME_SIZE   = get_env_size("DET_FRAME_SIZE", "960x540")
+HIRES_FRAME_SIZE = get_env_size("HIRES_FRAME_SIZE", "")
+
+# Preallocated decode buffers per VideoStream (grows only if consumers hold every buffer)
+FRAME_RING_SIZE = int(os.getenv("FRAME_RING_SIZE", 4))
+# no new frame for this long → stream is frozen (keyframes can be several seconds apart)
+STREAM_STALE_S  = float(os.getenv("STREAM_STALE_S", 10.0 if DECODE_MODE == "keyframe" else 3.0))
+PUMP_MAX_FPS    = float(os.getenv("PUMP_MAX_FPS", 25))      # per-camera cap on frames handed to processing
+
+# Automatic stream reconnection (exponential backoff with jitter)
+RECONNECT_ENABLE = get_env_bool("RECONNECT_ENABLE")
+RECONNECT_BASE_S = float(os.getenv("RECONNECT_BASE_S", 2))    # first retry delay
+RECONNECT_MAX_S  = float(os.getenv("RECONNECT_MAX_S", 300))   # cap between retries
+
+# Camera startup probes (start_all / bootstrap) run in parallel
+STARTUP_WORKERS    = int(os.getenv("STARTUP_WORKERS", 8))
+STARTUP_DEADLINE_S = float(os.getenv("STARTUP_DEADLINE_S", 10))  # whole batch; the rest go to reconnect
+
 # Flask secret key
 SECRET_KEY = os.getenv('SECRET_KEY', 'default_fallback_key')
\ No newline at end of file
@@ -1,38 +1,60 @@
 # custom_service/insightface_bundle/real_time_buffalo.py
 import time
+import cv2
 from insightface.app import FaceAnalysis
 import numpy as np
-from custom_service.insightface_bundle.verify_euclidean_dis import verify_identity
-from app.models.model import Embedding, db
-from flask import current_app      
+from app.utils.roi import is_rect, polygon_bounds
+from app.services.embedding_gallery import embedding_gallery
 from config.logger_config import cam_stat_logger , console_logger, exec_time_logger
 
-from custom_service.insightface_bundle.recog_split import recognize_faces
-from custom_service.silent_antispoof.real_time_antispoof import test
-from config.paths import MODELS_DIR, MODEL_PACK_NAME
+from collections import namedtuple
+from custom_service.insightface_bundle.recog_split import recognize_faces, recognize_faces_batch
+from custom_service.insightface_bundle.recog_split import rec_handler, load_rec_handler
+from custom_service.insightface_bundle.session_pool import SessionPool, configured_session_options, tune_model
+from config.paths import MODELS_DIR, MODEL_PACK_NAME, INFER_SESSIONS, ANTI_SPOOF
 spoof_dir = MODELS_DIR / "anti_spoof_models"
+NO_SPOOF = (False, 0.0, 0.0)
+if ANTI_SPOOF:
+    from custom_service.silent_antispoof.antispoof_engine import get_engine
+    spoof_engine = get_engine(spoof_dir)
+else:
+    spoof_engine = None
 # Initialize the InsightFace app with detection and recognition modules.
 # analy_app = FaceAnalysis(allowed_modules=['detection', 'recognition'])
 print(f"using model pack {MODEL_PACK_NAME}")
-analy_app = FaceAnalysis(name=MODEL_PACK_NAME ,allowed_modules=['detection', 'landmark_3d_68'])
-analy_app.prepare(ctx_id=0, det_size=(640, 640))
+
+def load_face_analysis(so=None):
+    """One detection + landmark model set (its own ONNX sessions)."""
+    face_app = FaceAnalysis(name=MODEL_PACK_NAME ,allowed_modules=['detection', 'landmark_3d_68'])
+    face_app.prepare(ctx_id=0, det_size=(640, 640))
+    if so is not None:
+        for model in face_app.models.values():
+            tune_model(model, so)
+    return face_app
+
+_sess_options = configured_session_options()
+analy_app = load_face_analysis(_sess_options)
+
+# every pool member owns its own detector and recognizer; the module-level
+# pair is member 0, INFER_SESSIONS > 1 loads independent copies
+ModelSession = namedtuple('ModelSession', ['analy_app', 'rec_handler'])
+session_pool = SessionPool(
+    lambda: ModelSession(load_face_analysis(_sess_options), load_rec_handler(_sess_options)),
+    size=INFER_SESSIONS,
+    first=ModelSession(analy_app, rec_handler)
+)
 
 def verification(input_embedding):
-    # Example usage with known embeddings from the database
-    with current_app.app_context():
-        embeddings = Embedding.query.all()
-        
-        # Now access the subject name through the relationship: emb.subject.subject_name
-        known_embeddings = [{
-            'subject_name': emb.subject.subject_name,
-            'embedding': np.array(emb.embedding)
-        } for emb in embeddings]
-                
-        # Get the top 1 closest match
-        matches = verify_identity(input_embedding, known_embeddings, top_n=1)
-        return matches
-
-def formatter(face, sub_nam, distance, spoof_res, elapsed_time=0):
+    # Get the top 1 closest match from the in-memory gallery
+    return embedding_gallery.match(input_embedding, top_n=1)[0]
+
+def verification_batch(input_embeddings):
+    """Match every face of a frame with a single matrix product."""
+    if len(input_embeddings) == 0:
+        return []
+    return embedding_gallery.match(np.stack(input_embeddings), top_n=1)
+
+def formatter(face, sub_nam, distance, spoof_res, elapsed_time=0, track_id=None):
     
     bbox = face.bbox
     landms = face.kps
@@ -101,6 +123,7 @@ def formatter(face, sub_nam, distance, spoof_res, elapsed_time=0):
         "subjects": [
             { "subject": sub_nam, "similarity": distance }
         ],  
+        "track_id": track_id,
         "execution_time": {
             "age": None,
             "gender": None,
@@ -112,50 +135,194 @@ def formatter(face, sub_nam, distance, spoof_res, elapsed_time=0):
 
     return compreface_result
 
-def detect_faces(img):
+def detect_faces(img, roi=None, session=None):
     """
     Runs face detection only (without recognition).
     Returns a list of detected face objects.
+    roi: optional normalised polygon; detection then runs on its bounding
+    crop only (the detector scales that crop up to det_size) and the
+    results are shifted back to full-frame coordinates.
+    session: pool member to run on (module-level analy_app by default).
     """
-    faces = analy_app.get(img, max_num=0)  # Runs both detection and recognition by default
+    face_app = session.analy_app if session is not None else analy_app
+    if roi is None:
+        return face_app.get(img, max_num=0)  # Runs both detection and recognition by default
+
+    h, w = img.shape[:2]
+    x1, y1, x2, y2 = polygon_bounds(roi, w, h)
+    if x2 - x1 < 16 or y2 - y1 < 16:
+        return []
+    crop = img[y1:y2, x1:x2]
+    if not is_rect(roi):
+        # blank everything outside the polygon
+        pts = np.array([[x * w - x1, y * h - y1] for x, y in roi], dtype=np.int32)
+        mask = np.zeros(crop.shape[:2], dtype=np.uint8)
+        cv2.fillPoly(mask, [pts], 255)
+        crop = cv2.bitwise_and(crop, crop, mask=mask)
+
+    faces = face_app.get(crop, max_num=0)
+    offset = np.array([x1, y1], dtype=np.float32)
+    for face in faces:
+        face.bbox = face.bbox + np.tile(offset, 2)
+        if face.kps is not None:
+            face.kps = face.kps + offset
+        if getattr(face, "landmark_3d_68", None) is not None:
+            lmk = face.landmark_3d_68.copy()
+            lmk[:, :2] += offset
+            face.landmark_3d_68 = lmk
     return faces
 
-def run_buffalo(frame):
+def select_for_recognition(faces, tracker=None):
+    """
+    Associate detections with the camera's tracks and pick the faces that
+    actually need the recognizer (new tracks, periodic or weak re-checks).
+    Returns (tracks, faces_to_recognize); tracks is all None without a tracker.
+    """
+    if tracker is None:
+        return [None] * len(faces), list(faces)
+    tracks = tracker.update([face.bbox for face in faces])
+    pending = [face for face, track in zip(faces, tracks) if tracker.needs_recognition(track)]
+    return tracks, pending
+
+def check_spoof(img, faces, tracks, tracker=None, scale=None):
+    """
+    Liveness verdict per face. All faces of the frame that need a check go
+    through the anti-spoof ensemble together; tracked faces reuse their
+    track's verdict until it is due for a re-check.
+    img/scale: image to crop from and the detection → img factor (see recognition_source).
+    """
+    if spoof_engine is None or not faces:
+        return [NO_SPOOF] * len(faces)
+    results = [None] * len(faces)
+    pending = []
+    for idx, track in enumerate(tracks):
+        if tracker is not None and track is not None and not tracker.needs_spoof_check(track):
+            results[idx] = track.spoof_res
+        else:
+            pending.append(idx)
+    if pending:
+        sx, sy = scale if scale is not None else (1.0, 1.0)
+        boxes = [np.asarray(faces[idx].bbox[:4], dtype=np.float32) * [sx, sy, sx, sy] for idx in pending]
+        for idx, spoof_res in zip(pending, spoof_engine.predict_batch(img, boxes)):
+            results[idx] = spoof_res
+            if tracker is not None and tracks[idx] is not None:
+                tracker.record_spoof(tracks[idx], spoof_res)
+    return results
+
+def match_and_format(faces_per_frame, tracks_per_frame=None, trackers=None, spoof_per_frame=None):
+    """
+    Match the embedded faces of one or more frames against the gallery in a
+    single call and return one list of CompreFace-style results per frame.
+    Faces skipped by the tracker reuse their track's confirmed identity.
+    spoof_per_frame: optional check_spoof() results, one list per frame.
+    """
+    if tracks_per_frame is None:
+        tracks_per_frame = [[None] * len(faces or []) for faces in faces_per_frame]
+    if trackers is None:
+        trackers = [None] * len(faces_per_frame)
+    if spoof_per_frame is None:
+        spoof_per_frame = [[NO_SPOOF] * len(faces or []) for faces in faces_per_frame]
+
+    kept = []
+    for faces in faces_per_frame:
+        for face in faces or []:
+            if face.embedding is not None:
+                kept.append(face)
+    all_matches = verification_batch([face.embedding for face in kept])
+    matched = {id(face): matches for face, matches in zip(kept, all_matches)}
+
+    compreface_results = [[] for _ in faces_per_frame]
+    for frame_idx, faces in enumerate(faces_per_frame):
+        tracker = trackers[frame_idx]
+        for face, track, spoof_res in zip(faces or [], tracks_per_frame[frame_idx], spoof_per_frame[frame_idx]):
+            if id(face) in matched:
+                matches = matched[id(face)]
+                # Ensure matches exist before accessing
+                if not matches:
+                    print("No match found")
+                    continue  # Skip to the next face
+                sub_nam, distance = matches[0]["subject_name"], matches[0]["distance"]
+                if tracker is not None and track is not None:
+                    tracker.record_identity(
+                        track, sub_nam, distance, face.embedding, subject_id=matches[0]["subject_id"]
+                    )
+            elif track is not None and track.has_identity:
+                # tracked face, recognizer skipped this frame
+                sub_nam, distance = track.subject_name, track.distance
+                face.embedding = track.embedding
+            else:
+                print("no embedding generated")
+                continue
+            compreface_result = formatter(
+                face, sub_nam, distance, spoof_res, elapsed_time=0,
+                track_id=track.id if track is not None else None
+            )
+            compreface_results[frame_idx].append(compreface_result)
+    return compreface_results
+
+def recognition_source(frame, hires=None):
+    """
+    Image to cut recognition crops from and the (sx, sy) factor that maps
+    detection coordinates onto it: the high-res frame when there is one.
+    """
+    if hires is None:
+        return frame, None
+    return hires, (hires.shape[1] / frame.shape[1], hires.shape[0] / frame.shape[0])
+
+def run_buffalo(frame, tracker=None, hires=None, roi=None):
     # Run face detection and recognition
 
-    # Step 1: Detect faces
-    start_time = time.time()  # Start timing before reading the frame
-    detected_faces = detect_faces(frame)
-    frame_time = time.time() - start_time 
-    # exec_time_logger.debug(f"det {frame_time:.4f} seconds")    
-    # print(f"Detected {len(detected_faces)} faces.")
-
-    # Step 2: Recognize faces
-    # Step 1: Detect faces
-    start_time = time.time()  # Start timing before reading the frame
-    recognized_faces = recognize_faces(frame, detected_faces, mode='local') # remote
-    frame_time = time.time() - start_time 
+    # this thread owns one pool member until both models are done
+    with session_pool.acquire() as session:
+        # Step 1: Detect faces
+        start_time = time.time()  # Start timing before reading the frame
+        detected_faces = detect_faces(frame, roi, session=session)
+        frame_time = time.time() - start_time 
+        # exec_time_logger.debug(f"det {frame_time:.4f} seconds")    
+        # print(f"Detected {len(detected_faces)} faces.")
+
+        # Step 2: Recognize faces (only the ones the tracker can't vouch for)
+        start_time = time.time()  # Start timing before reading the frame
+        tracks, pending = select_for_recognition(detected_faces, tracker)
+        rec_img, kps_scale = recognition_source(frame, hires)
+        recognized_faces = recognize_faces(
+            rec_img, pending, mode='local', kps_scale=kps_scale, handler=session.rec_handler
+        ) # remote
+        frame_time = time.time() - start_time 
     # exec_time_logger.debug(f"rec {frame_time:.4f} seconds")      
     # print(f"rec {recognized_faces}")
-    compreface_results = []
-    # For each detected face, store the embedding in the DB
-    if recognized_faces is not None:
-        for face in recognized_faces:
-            # spoof_res = test(frame, face.bbox, str(spoof_dir), 0)
-            spoof_res = [False, 0.0, 0.0]
-
-            embedding = face.embedding  # Expected to be a numpy array
-            if embedding is None:
-                print("no embedding generated")
-                continue
-            matches = verification(embedding)
+    if recognized_faces is None:
+        return []
+    spoof = check_spoof(rec_img, detected_faces, tracks, tracker, kps_scale)
+    return match_and_format([detected_faces], [tracks], [tracker], [spoof])[0]
 
-            # Ensure matches exist before accessing
-            if not matches:
-                print("No match found")
-                continue  # Skip to the next face
-            # print(f"faces {face}")
-            compreface_result = formatter(face, matches[0]["subject_name"], matches[0]["distance"], spoof_res, elapsed_time=0)
-            compreface_results.append(compreface_result)
+def run_buffalo_batch(frames, trackers=None, hires_frames=None, rois=None):
+    """
+    Detection + recognition for frames coming from several cameras.
+    Detection runs per frame (SCRFD is single-image), recognition and
+    gallery matching run once for all faces of the whole batch.
+    trackers: optional per-frame FaceTracker (None entries allowed).
+    hires_frames: optional per-frame high-res copies to crop faces from.
+    rois: optional per-frame detection ROI polygons.
+    """
+    if trackers is None:
+        trackers = [None] * len(frames)
+    if hires_frames is None:
+        hires_frames = [None] * len(frames)
+    if rois is None:
+        rois = [None] * len(frames)
+    with session_pool.acquire() as session:
+        detected = [detect_faces(frame, roi, session=session) for frame, roi in zip(frames, rois)]
 
-    return compreface_results
+        tracks, pending = [], []
+        for frame, hires, faces, tracker in zip(frames, hires_frames, detected, trackers):
+            frame_tracks, frame_pending = select_for_recognition(faces, tracker)
+            tracks.append(frame_tracks)
+            rec_img, kps_scale = recognition_source(frame, hires)
+            pending.append((rec_img, frame_pending, kps_scale))
+        recognize_faces_batch(pending, handler=session.rec_handler)
+    spoof = [
+        check_spoof(rec_img, faces, frame_tracks, tracker, kps_scale)
+        for (rec_img, _, kps_scale), faces, frame_tracks, tracker in zip(pending, detected, tracks, trackers)
+    ]
+    return match_and_format(detected, tracks, trackers, spoof)
@@ -7,6 +7,7 @@ from config.paths import INSIGHT_MODELS, MODEL_PACK_NAME, SECRET_KEY
 import numpy as np
 from insightface.utils import face_align
 import jwt
+from custom_service.insightface_bundle.session_pool import configured_session_options, tune_model
 
 # Load model for local processing
 model_file_map = {
@@ -20,15 +21,48 @@ model_file_map = {
 model_filename = model_file_map.get(MODEL_PACK_NAME, "w600k_r50.onnx")
 rec_model = INSIGHT_MODELS / MODEL_PACK_NAME / model_filename
 
-rec_handler = get_model(str(rec_model))
-rec_handler.prepare(ctx_id=0)
+def load_rec_handler(so=None):
+    """One recognition model instance (its own ONNX session)."""
+    handler = get_model(str(rec_model))
+    handler.prepare(ctx_id=0)
+    if so is not None:
+        tune_model(handler, so)
+    return handler
 
-def recognize_faces_local(img, faces):
-    """Runs face recognition locally."""
-    for face in faces:
-        rec_handler.get(img, face)  # Apply recognition model
+rec_handler = load_rec_handler(configured_session_options())
+
+def recognize_faces_local(img, faces, kps_scale=None, handler=None):
+    """Runs face recognition locally, one batched ONNX run for all faces."""
+    recognize_faces_batch([(img, faces, kps_scale)], handler=handler)
     return faces
 
+def recognize_faces_batch(items, handler=None):
+    """
+    Runs face recognition locally for several frames at once.
+    items: list of (img, faces) or (img, faces, kps_scale); every face of
+    every frame goes through a single get_feat call and gets its embedding
+    assigned in place. kps_scale = (sx, sy) maps landmarks found on a smaller
+    detection frame onto img. handler: recognition model to use (a session
+    pool member), the module-level rec_handler by default.
+    """
+    handler = handler or rec_handler
+    aligned, targets = [], []
+    for img, faces, *rest in items:
+        kps_scale = rest[0] if rest else None
+        for face in faces:
+            kps = face.kps if kps_scale is None else face.kps * np.asarray(kps_scale, dtype=np.float32)
+            # Align every crop exactly like rec_handler.get() does
+            aligned.append(
+                face_align.norm_crop(img, landmark=kps, image_size=handler.input_size[0])
+            )
+            targets.append(face)
+    if not aligned:
+        return items
+    embeddings = handler.get_feat(aligned)
+    for face, emb in zip(targets, embeddings):
+        face.embedding = emb.flatten()
+    return items
+
 # Generate a valid JWT token for authentication
 def generate_token():
     payload = {
@@ -73,7 +107,7 @@ def recognize_faces_remote(img, faces):
     
     return faces
 
-def recognize_faces(img, faces, mode="local"):
+def recognize_faces(img, faces, mode="local", kps_scale=None, handler=None):
     """
     Recognizes faces using either local or remote processing.
     :param img: Image array
@@ -82,7 +116,7 @@ def recognize_faces(img, faces, mode="local"):
     :return: Recognized face data
     """
     if mode == "local":
-        return recognize_faces_local(img, faces)
+        return recognize_faces_local(img, faces, kps_scale=kps_scale, handler=handler)
     elif mode == "remote":
         return recognize_faces_remote(img, faces)
     else:
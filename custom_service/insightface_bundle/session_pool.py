@@ -0,0 +1,79 @@
+# custom_service/insightface_bundle/session_pool.py
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+import onnxruntime as ort
+from config.paths import INFER_SESSIONS, INFER_INTRA_THREADS
+
+def session_options(intra_threads):
+    """ORT options for one pool member: a fixed share of the cores, no inter-op fan-out."""
+    so = ort.SessionOptions()
+    so.intra_op_num_threads = intra_threads
+    so.inter_op_num_threads = 1
+    so.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return so
+
+def intra_threads_for(sessions, intra_threads=0):
+    """Threads per session: explicit value, or the cores split evenly across sessions."""
+    if intra_threads > 0:
+        return intra_threads
+    return max(1, (os.cpu_count() or 1) // max(1, sessions))
+
+def configured_session_options():
+    """Options for the INFER_SESSIONS pool members; None keeps ORT defaults (single untuned session)."""
+    if INFER_SESSIONS <= 1 and INFER_INTRA_THREADS <= 0:
+        return None
+    return session_options(intra_threads_for(INFER_SESSIONS, INFER_INTRA_THREADS))
+
+def tune_model(model, so):
+    """
+    Rebuild an insightface model's ONNX session with `so`.
+    model_zoo.get_model only forwards providers to InferenceSession, so the
+    session options have to be applied afterwards; input/output names are
+    unchanged so the model object keeps working as is.
+    """
+    providers = model.session.get_providers()
+    model.session = ort.InferenceSession(model.model_file, sess_options=so, providers=providers)
+    return model
+
+class SessionPool:
+    """
+    N independent model sessions, each used by one thread at a time.
+
+    Callers borrow a session with `with pool.acquire() as session:`; while
+    they hold it nobody else runs on it, so N workers infer in parallel
+    without a global lock.
+    """
+    def __init__(self, factory, size=1, first=None):
+        self.size = max(1, int(size))
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self.stats = {'acquired': 0, 'waited': 0, 'wait_time': 0.0}
+        sessions = [first] if first is not None else []
+        while len(sessions) < self.size:
+            sessions.append(factory())
+        for session in sessions:
+            self._idle.put(session)
+
+    @contextmanager
+    def acquire(self, timeout=None):
+        start = time.monotonic()
+        try:
+            session = self._idle.get_nowait()
+        except queue.Empty:
+            session = self._idle.get(timeout=timeout)
+            with self._lock:
+                self.stats['waited'] += 1
+                self.stats['wait_time'] += time.monotonic() - start
+        with self._lock:
+            self.stats['acquired'] += 1
+        try:
+            yield session
+        finally:
+            self._idle.put(session)
+
+    def idle(self):
+        return self._idle.qsize()
@@ -9,34 +9,61 @@ def normalize(embedding):
         return embedding
     return embedding / norm
 
+# Row-wise L2 normalization for a (N, D) matrix of embeddings
+def normalize_rows(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if embeddings.ndim == 1:
+        embeddings = embeddings.reshape(1, -1)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
 # Function to calculate the Euclidean distance
 def euclidean_distance(embedding1, embedding2):
     return euclidean(embedding1, embedding2)
 
+def top_matches(queries, gallery, top_n=1):
+    """
+    Vectorized nearest-neighbour search over L2-normalized embeddings.
+
+    queries: (M, D) normalized float32, gallery: (N, D) normalized float32.
+    For unit vectors ||a - b|| = sqrt(2 - 2 * a.b), so one matrix product
+    gives the same Euclidean distances the per-row loop used to compute.
+    Returns (indices, distances), both (M, k) with k = min(top_n, N),
+    sorted by ascending distance.
+    """
+    k = min(top_n, gallery.shape[0])
+    if k == 0:
+        empty = np.empty((queries.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+
+    sims = queries @ gallery.T
+    if k < sims.shape[1]:
+        idx = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.tile(np.arange(sims.shape[1]), (sims.shape[0], 1))
+    part = np.take_along_axis(sims, idx, axis=1)
+    order = np.argsort(-part, axis=1)
+    idx = np.take_along_axis(idx, order, axis=1)
+    part = np.take_along_axis(part, order, axis=1)
+    distances = np.sqrt(np.clip(2.0 - 2.0 * part, 0.0, None))
+    return idx, distances
+
 # Function to verify the top N closest matches
 def verify_identity(input_embedding, known_embeddings, top_n=1):
-    # Normalize the input embedding
-    input_embedding = normalize(input_embedding)
-    
-    distances = []
-    
-    # Calculate the distance for each known embedding
-    for emb in known_embeddings:
-        known_embedding = normalize(emb['embedding'])
-        distance = euclidean_distance(input_embedding, known_embedding)
-        
-        # Store the distance with the corresponding subject name
-        distances.append({
-            'subject_name': emb['subject_name'],
-            'distance': distance
-        })
-    
-    # Sort the distances by ascending order (smallest distance first)
-    distances.sort(key=lambda x: x['distance'])
-    
-    # Get the top N matches (or as many as possible based on the threshold)
-    matches = []
-    for i in range(min(top_n, len(distances))):
-            matches.append(distances[i])  # Add the match if it's below the threshold
-    
-    return matches
+    if not known_embeddings:
+        return []
+
+    query = normalize_rows(input_embedding)
+    gallery = normalize_rows(np.stack([emb['embedding'] for emb in known_embeddings]))
+
+    idx, distances = top_matches(query, gallery, top_n=top_n)
+
+    # Get the top N matches (smallest distance first)
+    return [
+        {
+            'subject_name': known_embeddings[i]['subject_name'],
+            'distance': float(d)
+        }
+        for i, d in zip(idx[0], distances[0])
+    ]
@@ -5,7 +5,7 @@ from custom_service.yunet_detection import FaceDetectorYunet, convert_yunet_to_c
 from config.paths import MODELS_DIR
 from config.logger_config import cam_stat_logger , console_logger, exec_time_logger, det_logger
 
-from custom_service.insightface_bundle.real_time_buffalo import run_buffalo 
+from custom_service.insightface_bundle.real_time_buffalo import run_buffalo, run_buffalo_batch
 # from custom_service.pytorch_tensorRT.real_time_trt import run_trt
 
 def yunet_detect(frame):
@@ -23,9 +23,9 @@ def yunet_detect(frame):
 
     return compreface_results
          
-def insightface_buffalo(frame):
+def insightface_buffalo(frame, tracker=None, hires=None, roi=None):
     try:
-        compreface_results = run_buffalo(frame)
+        compreface_results = run_buffalo(frame, tracker=tracker, hires=hires, roi=roi)
     except Exception as e:
         print(e)
         traceback.print_exc() 
@@ -33,6 +33,16 @@ def insightface_buffalo(frame):
         compreface_results = []   
     return compreface_results
 
+def insightface_buffalo_batch(frames, trackers=None, hires_frames=None, rois=None):
+    try:
+        compreface_results = run_buffalo_batch(frames, trackers=trackers, hires_frames=hires_frames, rois=rois)
+    except Exception as e:
+        print(e)
+        traceback.print_exc() 
+
+        compreface_results = [[] for _ in frames]
+    return compreface_results
+
 # def tensorrt_buffalo(frame):
 #     try:
 #         compreface_results = run_trt(frame)
@@ -16,6 +16,7 @@ import torch.nn.functional as F
 from custom_service.silent_antispoof.MiniFASNet import MiniFASNetV1, MiniFASNetV2,MiniFASNetV1SE,MiniFASNetV2SE
 import custom_service.silent_antispoof.transform as trans
 from custom_service.silent_antispoof.utility import get_kernel, parse_model_name
+from custom_service.silent_antispoof.antispoof_engine import AntiSpoofEngine
 
 MODEL_MAPPING = {
     'MiniFASNetV1': MiniFASNetV1,
@@ -24,32 +25,40 @@ MODEL_MAPPING = {
     'MiniFASNetV2SE':MiniFASNetV2SE
 }
 
+def load_model(model_path, device):
+    """Build the MiniFASNet named by the file and load its weights (eval mode)."""
+    model_name = os.path.basename(model_path)
+    h_input, w_input, model_type, _ = parse_model_name(model_name)
+    kernel_size = get_kernel(h_input, w_input,)
+    model = MODEL_MAPPING[model_type](conv6_kernel=kernel_size).to(device)
+
+    # load model weight
+    state_dict = torch.load(model_path, map_location=device)
+    keys = iter(state_dict)
+    first_layer_name = keys.__next__()
+    if first_layer_name.find('module.') >= 0:
+        from collections import OrderedDict
+        new_state_dict = OrderedDict()
+        for key, value in state_dict.items():
+            name_key = key[7:]
+            new_state_dict[name_key] = value
+        model.load_state_dict(new_state_dict)
+    else:
+        model.load_state_dict(state_dict)
+    model.eval()
+    return model
+
 class AntiSpoofPredict():
     def __init__(self, device_id):
         self.device = torch.device("cuda:{}".format(device_id)
                                    if torch.cuda.is_available() else "cpu")
+        self._models = {}   # model_path → loaded model
 
     def _load_model(self, model_path):
-        # define model
-        model_name = os.path.basename(model_path)
-        h_input, w_input, model_type, _ = parse_model_name(model_name)
-        print(f"height: {h_input}, width: {w_input}")
-        self.kernel_size = get_kernel(h_input, w_input,)
-        self.model = MODEL_MAPPING[model_type](conv6_kernel=self.kernel_size).to(self.device)
-
-        # load model weight
-        state_dict = torch.load(model_path, map_location=self.device)
-        keys = iter(state_dict)
-        first_layer_name = keys.__next__()
-        if first_layer_name.find('module.') >= 0:
-            from collections import OrderedDict
-            new_state_dict = OrderedDict()
-            for key, value in state_dict.items():
-                name_key = key[7:]
-                new_state_dict[name_key] = value
-            self.model.load_state_dict(new_state_dict)
-        else:
-            self.model.load_state_dict(state_dict)
+        # weights are read once per path, later calls reuse the loaded model
+        self.model = self._models.get(model_path)
+        if self.model is None:
+            self.model = self._models[model_path] = load_model(model_path, self.device)
         return None
 
     def predict(self, img, model_path):
@@ -59,8 +68,24 @@ class AntiSpoofPredict():
         img = test_transform(img)
         img = img.unsqueeze(0).to(self.device)
         self._load_model(model_path)
-        self.model.eval()
         with torch.no_grad():
             result = self.model.forward(img)
             result = F.softmax(result).cpu().numpy()
         return result
+
+class TorchAntiSpoofEngine(AntiSpoofEngine):
+    """AntiSpoofEngine running the original .pth weights on PyTorch."""
+    extension = '.pth'
+
+    def __init__(self, model_dir, device_id=0):
+        self.device = torch.device("cuda:{}".format(device_id)
+                                   if torch.cuda.is_available() else "cpu")
+        super().__init__(model_dir, device_id)
+
+    def _load_model(self, model_path):
+        return load_model(model_path, self.device)
+
+    def _forward(self, model, batch):
+        with torch.no_grad():
+            out = model(torch.from_numpy(batch).to(self.device))
+            return F.softmax(out, dim=1).cpu().numpy()
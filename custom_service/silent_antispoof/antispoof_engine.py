@@ -0,0 +1,109 @@
+# custom_service/silent_antispoof/antispoof_engine.py
+import os
+import threading
+import time
+import numpy as np
+
+from custom_service.silent_antispoof.generate_patches import CropImage
+from custom_service.silent_antispoof.utility import parse_model_name
+
+REAL_LABEL = 1
+
+def xyxy_to_xywh(bbox):
+    """Detector box [x1, y1, x2, y2] → the [x, y, w, h] CropImage expects."""
+    x1, y1, x2, y2 = (float(v) for v in bbox[:4])
+    return [x1, y1, max(1.0, x2 - x1), max(1.0, y2 - y1)]
+
+def softmax(logits):
+    e = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+class AntiSpoofEngine:
+    """
+    MiniFASNet ensemble loaded once.
+
+    predict_batch() cuts every face of a frame at each model's scale and
+    input size and runs a single forward pass per model for all of them;
+    the softmax outputs are averaged over the ensemble as in test().
+    Subclasses provide the runtime: `extension` of the model files,
+    `_load_model(path)` and `_forward(model, batch) → probabilities`.
+    """
+    extension = None
+
+    def __init__(self, model_dir, device_id=0):
+        self.device_id = device_id
+        self.cropper = CropImage()
+        self.models = []   # (name, model, h_input, w_input, scale)
+        for model_name in sorted(os.listdir(model_dir)):
+            if not model_name.endswith(self.extension):
+                continue
+            h_input, w_input, _, scale = parse_model_name(model_name)
+            model = self._load_model(os.path.join(model_dir, model_name))
+            self.models.append((model_name, model, h_input, w_input, scale))
+        if not self.models:
+            raise FileNotFoundError(f"no {self.extension} anti-spoof models in {model_dir}")
+        self.stats = {'batches': 0, 'faces': 0}
+
+    def _load_model(self, model_path):
+        raise NotImplementedError
+
+    def _forward(self, model, batch):
+        raise NotImplementedError
+
+    def _crops(self, frame, boxes, h_input, w_input, scale):
+        crops = [
+            self.cropper.crop(frame, box, scale, w_input, h_input, crop=scale is not None)
+            for box in boxes
+        ]
+        # same layout as transform.to_tensor: NCHW float, not scaled to 0..1
+        return np.ascontiguousarray(np.stack(crops).transpose(0, 3, 1, 2), dtype=np.float32)
+
+    def predict_batch(self, frame, bboxes):
+        """
+        bboxes: detector boxes [x1, y1, x2, y2] in frame coordinates.
+        Returns one (is_spoof, score, duration) per box; duration is the
+        per-face share of the ensemble time.
+        """
+        if len(bboxes) == 0:
+            return []
+        boxes = [xyxy_to_xywh(bbox) for bbox in bboxes]
+        prediction = np.zeros((len(boxes), 3))
+        start = time.time()
+        for _, model, h_input, w_input, scale in self.models:
+            prediction += self._forward(model, self._crops(frame, boxes, h_input, w_input, scale))
+        duration = (time.time() - start) / len(boxes)
+        self.stats['batches'] += 1
+        self.stats['faces'] += len(boxes)
+
+        results = []
+        for row in prediction:
+            label = int(np.argmax(row))
+            score = float(row[label] / len(self.models))
+            results.append((label != REAL_LABEL, score, duration))
+        return results
+
+    def predict(self, frame, bbox):
+        return self.predict_batch(frame, [bbox])[0]
+
+def has_models(model_dir, extension):
+    return any(name.endswith(extension) for name in os.listdir(model_dir))
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_engine(model_dir, device_id=0):
+    """
+    Shared engine per model directory, loaded on first use. Exported .onnx
+    models run on ONNX Runtime (no torch import); otherwise the .pth
+    weights are loaded with PyTorch.
+    """
+    key = (str(model_dir), device_id)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            if has_models(str(model_dir), '.onnx'):
+                from custom_service.silent_antispoof.onnx_predict import OnnxAntiSpoofEngine as engine_cls
+            else:
+                from custom_service.silent_antispoof.anti_spoof_predict import TorchAntiSpoofEngine as engine_cls
+            engine = _engines[key] = engine_cls(str(model_dir), device_id)
+        return engine
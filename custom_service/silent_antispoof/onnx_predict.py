@@ -0,0 +1,28 @@
+# custom_service/silent_antispoof/onnx_predict.py
+import onnxruntime as ort
+
+from custom_service.silent_antispoof.antispoof_engine import AntiSpoofEngine, softmax
+from config.paths import USE_CUDA
+
+def antispoof_providers():
+    available = ort.get_available_providers()
+    wanted = ['CUDAExecutionProvider', 'CPUExecutionProvider'] if USE_CUDA else ['CPUExecutionProvider']
+    return [p for p in wanted if p in available] or available
+
+class OnnxAntiSpoofEngine(AntiSpoofEngine):
+    """
+    AntiSpoofEngine running the exported .onnx models (scripts/export_antispoof_onnx.py)
+    on ONNX Runtime: numpy preprocessing and softmax, no torch import.
+    """
+    extension = '.onnx'
+
+    def _load_model(self, model_path):
+        so = ort.SessionOptions()
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session = ort.InferenceSession(model_path, sess_options=so, providers=antispoof_providers())
+        return session, session.get_inputs()[0].name
+
+    def _forward(self, model, batch):
+        session, input_name = model
+        logits = session.run(None, {input_name: batch})[0]
+        return softmax(logits)
@@ -4,15 +4,18 @@
 # @Company : Minivision
 # @File : utility.py
 # @Software : PyCharm
+import os
 
 def get_kernel(height, width):
     kernel_size = ((height + 15) // 16, (width + 15) // 16)
     return kernel_size
 
 def parse_model_name(model_name):
+    # "2.7_80x80_MiniFASNetV2.pth" / ".onnx" → (80, 80, "MiniFASNetV2", 2.7)
+    model_name = os.path.splitext(os.path.basename(model_name))[0]
     info = model_name.split('_')[0:-1]
     h_input, w_input = info[-1].split('x')
-    model_type = model_name.split('.pth')[0].split('_')[-1]
+    model_type = model_name.split('_')[-1]
 
     if info[0] == "org":
         scale = None
@@ -1,19 +1,38 @@
 # integrations/custom_service.py
 # from custom_service.main_run import yunet_detect, find_faces_post, init_model, RetinaFace_detect
-from custom_service.main_run import insightface_buffalo
+from custom_service.main_run import insightface_buffalo, insightface_buffalo_batch
 # from custom_service.main_run import tensorrt_buffalo
-from config.paths import IS_RECOGNIZE
-from config.state import model_lock
+from config.paths import IS_RECOGNIZE, INFER_BATCHING, INFER_MAX_BATCH, INFER_MAX_WAIT_MS, INFER_WORKERS
 from app.services.settings_manage import settings
+from app.services.inference_scheduler import InferenceScheduler
 
-def cutm_integ(frame):
-    with model_lock:
-        if settings.get("RECOGNIZE"):
-            # results = yunet_detect(frame)
-            # results = RetinaFace_detect(frame)
-            # results = find_faces_post(frame)
-            results = insightface_buffalo(frame)
-            # results = tensorrt_buffalo(frame)
-        else:
-            results = None
-        return results
\ No newline at end of file
+def _run_batch(frames, contexts):
+    """Unpack the per-frame options submitted through the scheduler."""
+    contexts = [ctx or {} for ctx in contexts]
+    return insightface_buffalo_batch(
+        frames,
+        trackers=[ctx.get('tracker') for ctx in contexts],
+        hires_frames=[ctx.get('hires') for ctx in contexts],
+        rois=[ctx.get('roi') for ctx in contexts]
+    )
+
+# frames from every camera are merged into short batches by one scheduler thread
+inference_scheduler = InferenceScheduler(
+    _run_batch,
+    max_batch=INFER_MAX_BATCH,
+    max_wait_ms=INFER_MAX_WAIT_MS,
+    workers=INFER_WORKERS,
+)
+
+def cutm_integ(frame, cam_name=None, tracker=None, hires=None, roi=None):
+    if not settings.get("RECOGNIZE"):
+        return None
+    if INFER_BATCHING:
+        return inference_scheduler.infer(cam_name, frame, context={'tracker': tracker, 'hires': hires, 'roi': roi})
+    # no global lock: run_buffalo borrows one of the INFER_SESSIONS model sessions
+    # results = yunet_detect(frame)
+    # results = RetinaFace_detect(frame)
+    # results = find_faces_post(frame)
+    results = insightface_buffalo(frame, tracker=tracker, hires=hires, roi=roi)
+    # results = tensorrt_buffalo(frame)
+    return results
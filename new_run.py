@@ -6,10 +6,12 @@ from flask_cors import CORS
 from config.paths import cam_sources, PORT, MAX_CAM_WORKERS
 from scripts.manage_db import manage_table
 from app.services.settings_manage import settings, seed_feature_flags
+from app.services.embedding_gallery import embedding_gallery
+from app.services.detection_writer import detection_writer
 from app.services.camera_manager import camera_service
 from app.services.processing_service import ProcessingService
 from app.processors.face_detection import FaceDetectionProcessor
-from app.app_setup import create_app, socketio, db, send_frame
+from app.app_setup import create_app, socketio, db, send_frame, pump_live_feed
 
 app = create_app()
 CORS(app, resources={r"/*": {"origins": "*"}})
@@ -24,6 +26,7 @@ def graceful_shutdown(*args):
     """Stop all streams and log stops inside app context, then exit on signal."""
     with app.app_context():
         camera_service.stop_all()
+        detection_writer.stop()
         sys.exit(0)  # only here, in the signal handler
 
 # Register teardown handlers
@@ -40,8 +43,16 @@ if __name__ == "__main__":
         seed_feature_flags()
         # now load settings from the database:
         settings.init_app(app)
+        # load every enrolled embedding into memory once
+        embedding_gallery.init_app(app)
+        # Detection rows are bulk-inserted off the inference threads
+        detection_writer.init_app(app)
         # Kick off the frame‐pumping loop with frame skipping
         socketio.start_background_task(send_frame, processing)
+        # One encoder/emitter for every watched camera
+        socketio.start_background_task(pump_live_feed)
+        # Restart streams that die on their own (backoff + jitter)
+        socketio.start_background_task(camera_service.supervise, app, socketio.sleep)
         # Start the server
         socketio.run(
             app,
@@ -0,0 +1,65 @@
+# scripts/export_antispoof_onnx.py
+"""
+Export the MiniFASNet anti-spoof weights (.pth) to ONNX next to them, so the
+runtime can use OnnxAntiSpoofEngine and skip PyTorch entirely.
+
+    python -m scripts.export_antispoof_onnx [--model-dir DIR] [--out-dir DIR]
+
+Every exported model is checked against PyTorch on random crops.
+"""
+import argparse
+import os
+import numpy as np
+import torch
+import onnxruntime as ort
+
+from custom_service.silent_antispoof.anti_spoof_predict import load_model
+from custom_service.silent_antispoof.antispoof_engine import softmax
+from custom_service.silent_antispoof.utility import parse_model_name
+from config.paths import MODELS_DIR
+
+def export_model(model_path, onnx_path, opset=13):
+    h_input, w_input, _, _ = parse_model_name(model_path)
+    model = load_model(model_path, torch.device("cpu"))
+    dummy = torch.zeros(1, 3, h_input, w_input, dtype=torch.float32)
+    torch.onnx.export(
+        model, dummy, onnx_path,
+        input_names=['input'], output_names=['logits'],
+        dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+        opset_version=opset,
+    )
+    return model
+
+def check_model(model, onnx_path, batch=4, seed=0):
+    """Largest absolute difference between torch and ORT softmax scores."""
+    h_input, w_input, _, _ = parse_model_name(onnx_path)
+    rng = np.random.default_rng(seed)
+    # crops are raw 0..255 pixel values (transform.to_tensor does not rescale)
+    crops = rng.integers(0, 256, size=(batch, 3, h_input, w_input)).astype(np.float32)
+    with torch.no_grad():
+        expected = torch.softmax(model(torch.from_numpy(crops)), dim=1).numpy()
+    session = ort.InferenceSession(onnx_path, providers=['CPUExecutionProvider'])
+    got = softmax(session.run(None, {session.get_inputs()[0].name: crops})[0])
+    return float(np.abs(expected - got).max())
+
+def export_all(model_dir, out_dir=None, opset=13, tolerance=1e-4):
+    out_dir = out_dir or model_dir
+    os.makedirs(out_dir, exist_ok=True)
+    for model_name in sorted(os.listdir(model_dir)):
+        if not model_name.endswith('.pth'):
+            continue
+        onnx_path = os.path.join(out_dir, os.path.splitext(model_name)[0] + '.onnx')
+        model = export_model(os.path.join(model_dir, model_name), onnx_path, opset)
+        diff = check_model(model, onnx_path)
+        status = "ok" if diff <= tolerance else "MISMATCH"
+        print(f"{model_name} → {onnx_path}  max|Δp|={diff:.2e} {status}")
+        if diff > tolerance:
+            raise RuntimeError(f"{onnx_path} differs from {model_name} by {diff:.2e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export anti-spoof models to ONNX")
+    parser.add_argument('--model-dir', default=str(MODELS_DIR / "anti_spoof_models"))
+    parser.add_argument('--out-dir', default=None)
+    parser.add_argument('--opset', type=int, default=13)
+    args = parser.parse_args()
+    export_all(args.model_dir, args.out_dir, args.opset)
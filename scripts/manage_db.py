@@ -1,10 +1,46 @@
 # scripts/manage_db.py
 from app.models.model import db, Detection, Camera, FaceRecogUser
 from sqlalchemy.exc import ProgrammingError
-from sqlalchemy import create_engine, MetaData, Table
+from sqlalchemy import create_engine, MetaData, Table, text
 from sqlalchemy.orm import sessionmaker
 from config.paths import IS_RM_REPORT
 
+# columns added after the first release; create_all() never alters existing tables
+COLUMN_MIGRATIONS = [
+    "ALTER TABLE camera ADD COLUMN IF NOT EXISTS roi JSONB",
+]
+
+# embedding.embedding ARRAY(float8) → bytea of big-endian float32, the
+# layout float4send() produces and app/utils/embedding_codec.py decodes
+EMBEDDING_BLOB_MIGRATION = [
+    "ALTER TABLE embedding ADD COLUMN IF NOT EXISTS embedding_blob BYTEA",
+    """UPDATE embedding SET embedding_blob = (
+           SELECT string_agg(float4send(v::real), ''::bytea ORDER BY i)
+           FROM unnest(embedding.embedding) WITH ORDINALITY AS t(v, i))""",
+    "ALTER TABLE embedding DROP COLUMN embedding",
+    "ALTER TABLE embedding RENAME COLUMN embedding_blob TO embedding",
+    "ALTER TABLE embedding ALTER COLUMN embedding SET NOT NULL",
+]
+
+def migrate_embedding_storage():
+    """Convert embeddings stored as float arrays to blobs, once, in one transaction."""
+    data_type = db.session.execute(text(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_name = 'embedding' AND column_name = 'embedding'"
+    )).scalar()
+    if data_type != 'ARRAY':
+        return
+    for stmt in EMBEDDING_BLOB_MIGRATION:
+        db.session.execute(text(stmt))
+    print("Migrated embedding vectors from float arrays to float32 blobs.")
+
+def migrate_columns():
+    """Bring existing tables up to the current models (idempotent)."""
+    for stmt in COLUMN_MIGRATIONS:
+        db.session.execute(text(stmt))
+    migrate_embedding_storage()
+    db.session.commit()
+
 def manage_table(purge=False, drop=False, spec=False):
     try:
         if purge:
@@ -31,6 +67,7 @@ def manage_table(purge=False, drop=False, spec=False):
             # Ensure the table exists
             db.create_all()
             print("Created all the table if it didn't exist.")
+        migrate_columns()
     except ProgrammingError:
         print("The table does not exist yet.")  
 